@@ -1,10 +1,4 @@
 #!/usr/bin/env python
-import os
-import sys
-
-# Add the project root directory to the Python path
-sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
-
 # Import the main module from src
 from src.main import main
 
@@ -2,8 +2,8 @@
 import os
 import sys
 import logging
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser
 
 # Configure logging
 logging.basicConfig(
@@ -19,68 +19,120 @@ url = "https://www.tripadvisor.ca/Restaurant_Review-g155004-d683500-Reviews-Ceyl
 headers = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
 }
 
-# Fetch the page
-try:
-    logger.info(f"Fetching URL: {url}")
-    response = requests.get(url, headers=headers, timeout=30)
-    response.raise_for_status()
-    logger.info(f"Response status: {response.status_code}")
-    
-    # Parse HTML
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    # Check for restaurant name
-    logger.info("Looking for restaurant name...")
-    name_element = soup.select('h1.HjBfq')
-    if name_element:
-        logger.info(f"Found name element: {name_element[0].text.strip()}")
-    else:
-        logger.warning("Name element not found with selector 'h1.HjBfq'")
-        # Try a few other selectors that might match
-        alt_selectors = ['h1', '.HjBfq', '.QjLKt', '.fHibz', '.eCPON']
-        for selector in alt_selectors:
-            elements = soup.select(selector)
-            if elements:
-                logger.info(f"Found potential name elements with '{selector}': {[e.text.strip() for e in elements[:3]]}")
+# Where the fetched page is saved for inspection
+DEBUG_HTML_PATH = 'tripadvisor_debug.html'
+
+# Selectors the TripAdvisor crawler relies on
+NAME_SELECTOR = 'h1.HjBfq'
+RATING_SELECTOR = 'span.ZDEqb'
+REVIEW_SELECTOR = '.review-container'
+
+# Fallback selectors to probe when the primary selector finds nothing
+NAME_ALT_SELECTORS = ['h1', '.HjBfq', '.QjLKt', '.fHibz', '.eCPON']
+RATING_ALT_SELECTORS = ['.ZDEqb', '.bvcwU', '.UctUV', '.cNJsk']
+REVIEW_ALT_SELECTORS = ['.review', '.cWwQK', '.dDKKM', '.glbfwR']
+
+ALL_SELECTORS = [
+    NAME_SELECTOR, RATING_SELECTOR, REVIEW_SELECTOR,
+    *NAME_ALT_SELECTORS, *RATING_ALT_SELECTORS, *REVIEW_ALT_SELECTORS,
+]
+
+
+def probe_selectors(tree, selectors):
+    """Match a group of selectors with a single tree walk"""
+    matches = {selector: [] for selector in selectors}
+    # A grouped selector yields an element once per member it matches
+    for element in dict.fromkeys(tree.css(', '.join(selectors))):
+        for selector in selectors:
+            if element.css_matches(selector):
+                matches[selector].append(element)
+    return matches
+
+
+def main():
+    """Fetch the debug URL and report which selectors match"""
+    # Keep-alive HTTP/2 client so requests to the same host share a connection
+    client = httpx.Client(
+        http2=True,
+        headers=headers,
+        timeout=30,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+    )
     
-    # Check for rating
-    logger.info("Looking for rating...")
-    rating_element = soup.select('span.ZDEqb')
-    if rating_element:
-        logger.info(f"Found rating element: {rating_element[0].text.strip()}")
-    else:
-        logger.warning("Rating element not found with selector 'span.ZDEqb'")
-        # Try other selectors
-        alt_selectors = ['.ZDEqb', '.bvcwU', '.UctUV', '.cNJsk']
-        for selector in alt_selectors:
-            elements = soup.select(selector)
-            if elements:
-                logger.info(f"Found potential rating elements with '{selector}': {[e.text.strip() for e in elements[:3]]}")
+    # Fetch the page
+    try:
+        logger.info(f"Fetching URL: {url}")
+        with client.stream('GET', url) as response:
+            response.raise_for_status()
+            logger.info(f"Response status: {response.status_code} ({response.http_version})")
+            
+            # Save HTML for inspection, streaming it to disk rather than
+            # keeping the raw bytes and the decoded text in memory
+            with open(DEBUG_HTML_PATH, 'wb') as f:
+                for chunk in response.iter_bytes(chunk_size=65536):
+                    f.write(chunk)
+        logger.info(f"Saved HTML to {DEBUG_HTML_PATH}")
+        
+        # Parse HTML
+        with open(DEBUG_HTML_PATH, 'rb') as f:
+            tree = LexborHTMLParser(f.read())
+        
+        # Resolve every primary and fallback selector in one pass
+        matches = probe_selectors(tree, ALL_SELECTORS)
+        
+        # Check for restaurant name
+        logger.info("Looking for restaurant name...")
+        name_element = matches[NAME_SELECTOR]
+        if name_element:
+            logger.info(f"Found name element: {name_element[0].text(strip=True)}")
+        else:
+            logger.warning(f"Name element not found with selector '{NAME_SELECTOR}'")
+            # Try a few other selectors that might match
+            for selector in NAME_ALT_SELECTORS:
+                elements = matches[selector]
+                if elements:
+                    logger.info(f"Found potential name elements with '{selector}': {[e.text(strip=True) for e in elements[:3]]}")
+        
+        # Check for rating
+        logger.info("Looking for rating...")
+        rating_element = matches[RATING_SELECTOR]
+        if rating_element:
+            logger.info(f"Found rating element: {rating_element[0].text(strip=True)}")
+        else:
+            logger.warning(f"Rating element not found with selector '{RATING_SELECTOR}'")
+            # Try other selectors
+            for selector in RATING_ALT_SELECTORS:
+                elements = matches[selector]
+                if elements:
+                    logger.info(f"Found potential rating elements with '{selector}': {[e.text(strip=True) for e in elements[:3]]}")
+        
+        # Check for reviews
+        logger.info("Looking for reviews...")
+        review_elements = matches[REVIEW_SELECTOR]
+        if review_elements:
+            logger.info(f"Found {len(review_elements)} review elements")
+            for i, review in enumerate(review_elements[:2]):
+                logger.info(f"Review {i+1} sample: {review.text()[:100]}...")
+        else:
+            logger.warning(f"Review elements not found with selector '{REVIEW_SELECTOR}'")
+            # Try other selectors
+            for selector in REVIEW_ALT_SELECTORS:
+                elements = matches[selector]
+                if elements:
+                    logger.info(f"Found {len(elements)} potential review elements with '{selector}'")
+
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
     
-    # Check for reviews
-    logger.info("Looking for reviews...")
-    review_elements = soup.select('.review-container')
-    if review_elements:
-        logger.info(f"Found {len(review_elements)} review elements")
-        for i, review in enumerate(review_elements[:2]):
-            logger.info(f"Review {i+1} sample: {review.get_text()[:100]}...")
-    else:
-        logger.warning("Review elements not found with selector '.review-container'")
-        # Try other selectors
-        alt_selectors = ['.review', '.cWwQK', '.dDKKM', '.glbfwR']
-        for selector in alt_selectors:
-            elements = soup.select(selector)
-            if elements:
-                logger.info(f"Found {len(elements)} potential review elements with '{selector}'")
+    finally:
+        client.close()
     
-    # Save HTML for inspection
-    with open('tripadvisor_debug.html', 'w', encoding='utf-8') as f:
-        f.write(response.text)
-    logger.info("Saved HTML to tripadvisor_debug.html")
+    logger.info("Debug completed")
 
-except Exception as e:
-    logger.error(f"Error: {str(e)}")
-    
-logger.info("Debug completed")
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -4,77 +4,110 @@ A utility script to export restaurant review data from the database to CSV files
 """
 import argparse
 import csv
-import os
-import sys
-from datetime import datetime
+import itertools
 
-# Add the project root directory to the Python path
-sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from sqlalchemy import select
 
-from src.database import Restaurant, Review, get_db_session
+from src.database import Restaurant, Review, db_session_scope
 
+# Large write buffer so big exports hit the disk in fewer syscalls
+WRITE_BUFFER_SIZE = 1 << 20
 
-def export_restaurants_to_csv(output_file):
+
+def format_timestamp(value):
+    """Format a datetime column for CSV output"""
+    # Same output as strftime('%Y-%m-%d %H:%M:%S') for the naive timestamps
+    # stored here, without parsing a format string for every row
+    return value.isoformat(sep=' ', timespec='seconds') if value else ''
+
+
+def export_restaurants_to_csv(output_file, db):
     """Export restaurants to a CSV file"""
-    db = get_db_session()
-    restaurants = db.query(Restaurant).all()
+    # Stream only the exported columns in batches instead of loading
+    # whole Restaurant objects for the entire table
+    restaurants = db.execute(
+        select(
+            Restaurant.id, Restaurant.name, Restaurant.address, Restaurant.city,
+            Restaurant.state, Restaurant.postal_code, Restaurant.phone,
+            Restaurant.website, Restaurant.cuisine_type, Restaurant.price_range,
+            Restaurant.average_rating, Restaurant.source_platform,
+            Restaurant.last_updated
+        ).execution_options(yield_per=1000)
+    )
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+    # zip() stops on the exhausted rows before advancing the counter, so
+    # next(counter) afterwards is the number of rows written
+    counter = itertools.count()
+    with open(output_file, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as csvfile:
         fieldnames = [
             'id', 'name', 'address', 'city', 'state', 'postal_code',
             'phone', 'website', 'cuisine_type', 'price_range',
             'average_rating', 'source_platform', 'last_updated'
         ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.writer(csvfile)
         
-        writer.writeheader()
-        for restaurant in restaurants:
-            writer.writerow({
-                'id': restaurant.id,
-                'name': restaurant.name,
-                'address': restaurant.address,
-                'city': restaurant.city,
-                'state': restaurant.state,
-                'postal_code': restaurant.postal_code,
-                'phone': restaurant.phone,
-                'website': restaurant.website,
-                'cuisine_type': restaurant.cuisine_type,
-                'price_range': restaurant.price_range,
-                'average_rating': restaurant.average_rating,
-                'source_platform': restaurant.source_platform,
-                'last_updated': restaurant.last_updated.strftime('%Y-%m-%d %H:%M:%S') if restaurant.last_updated else ''
-            })
+        writer.writerow(fieldnames)
+        writer.writerows(
+            (
+                row.id,
+                row.name,
+                row.address,
+                row.city,
+                row.state,
+                row.postal_code,
+                row.phone,
+                row.website,
+                row.cuisine_type,
+                row.price_range,
+                row.average_rating,
+                row.source_platform,
+                format_timestamp(row.last_updated)
+            )
+            for row, _ in zip(restaurants, counter)
+        )
     
-    print(f"Exported {len(restaurants)} restaurants to {output_file}")
+    print(f"Exported {next(counter)} restaurants to {output_file}")
 
 
-def export_reviews_to_csv(output_file):
+def export_reviews_to_csv(output_file, db):
     """Export reviews to a CSV file"""
-    db = get_db_session()
-    reviews = db.query(Review).all()
+    # Stream only the exported columns in batches instead of loading
+    # whole Review objects for the entire table
+    reviews = db.execute(
+        select(
+            Review.id, Review.restaurant_id, Review.rating, Review.review_text,
+            Review.review_date, Review.reviewer_name, Review.helpful_count,
+            Review.source_platform, Review.crawl_date
+        ).execution_options(yield_per=1000)
+    )
     
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+    # zip() stops on the exhausted rows before advancing the counter, so
+    # next(counter) afterwards is the number of rows written
+    counter = itertools.count()
+    with open(output_file, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as csvfile:
         fieldnames = [
             'id', 'restaurant_id', 'rating', 'review_text', 'review_date',
             'reviewer_name', 'helpful_count', 'source_platform', 'crawl_date'
         ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.writer(csvfile)
         
-        writer.writeheader()
-        for review in reviews:
-            writer.writerow({
-                'id': review.id,
-                'restaurant_id': review.restaurant_id,
-                'rating': review.rating,
-                'review_text': review.review_text,
-                'review_date': review.review_date.strftime('%Y-%m-%d %H:%M:%S') if review.review_date else '',
-                'reviewer_name': review.reviewer_name,
-                'helpful_count': review.helpful_count,
-                'source_platform': review.source_platform,
-                'crawl_date': review.crawl_date.strftime('%Y-%m-%d %H:%M:%S') if review.crawl_date else ''
-            })
+        writer.writerow(fieldnames)
+        writer.writerows(
+            (
+                row.id,
+                row.restaurant_id,
+                row.rating,
+                row.review_text,
+                format_timestamp(row.review_date),
+                row.reviewer_name,
+                row.helpful_count,
+                row.source_platform,
+                format_timestamp(row.crawl_date)
+            )
+            for row, _ in zip(reviews, counter)
+        )
     
-    print(f"Exported {len(reviews)} reviews to {output_file}")
+    print(f"Exported {next(counter)} reviews to {output_file}")
 
 
 def main():
@@ -95,11 +128,13 @@ def main():
     
     args = parser.parse_args()
     
-    print("Exporting restaurant data...")
-    export_restaurants_to_csv(args.restaurants)
-    
-    print("Exporting review data...")
-    export_reviews_to_csv(args.reviews)
+    # Share one session (and its pooled connection) across both exports
+    with db_session_scope() as db:
+        print("Exporting restaurant data...")
+        export_restaurants_to_csv(args.restaurants, db)
+        
+        print("Exporting review data...")
+        export_reviews_to_csv(args.reviews, db)
     
     print("Export completed successfully!")
 
@@ -3,29 +3,36 @@
 Selenium-based crawler runner for restaurant reviews.
 """
 import os
-import sys
 import argparse
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
-# Add the project root directory to the Python path
-sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 
-from src.database import init_db
+from src.config import set_demo_mode
+from src.database import ScopedSession, init_db
 from src.selenium_crawler import SeleniumTripAdvisorCrawler
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(__file__), 'crawler.log')),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger('selenium_crawler_runner')
 
 
+def _configure_logging() -> None:
+    """Log to crawler.log and the console"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(os.path.dirname(__file__), 'crawler.log')),
+            logging.StreamHandler()
+        ]
+    )
+
+
 def setup_argparse() -> argparse.ArgumentParser:
     """Set up command line argument parser"""
     parser = argparse.ArgumentParser(description='Selenium-based Restaurant Review Crawler')
@@ -56,56 +63,108 @@ def setup_argparse() -> argparse.ArgumentParser:
         action='store_true',
         help='Run in demo mode with mock data'
     )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help='Maximum number of restaurants to crawl in parallel (default: 4)'
+    )
     return parser
 
 
 def crawl_restaurant(crawler, url: str, max_reviews: int) -> None:
     """Crawl a restaurant and its reviews"""
     try:
-        logger.info(f"Crawling restaurant: {url}")
+        logger.info("Crawling restaurant: %s", url)
         restaurant_data = crawler.crawl_restaurant(url)
         
         if not restaurant_data:
-            logger.error(f"Failed to extract restaurant data from {url}")
+            logger.error("Failed to extract restaurant data from %s", url)
             return
         
         # Save restaurant to database
         restaurant = crawler.save_restaurant(restaurant_data)
-        logger.info(f"Saved restaurant: {restaurant.name} (ID: {restaurant.id})")
+        logger.info("Saved restaurant: %s (ID: %s)", restaurant.name, restaurant.id)
         
         # Crawl reviews
-        logger.info(f"Crawling reviews for restaurant: {restaurant.name}")
+        logger.info("Crawling reviews for restaurant: %s", restaurant.name)
         review_data_list = crawler.crawl_reviews(url, restaurant.id)
         
         # Limit the number of reviews to save
         review_data_list = review_data_list[:max_reviews]
         
-        # Save reviews to database
-        for review_data in review_data_list:
-            review = crawler.save_review(review_data, restaurant.id)
-            logger.debug(f"Saved review from {review.reviewer_name} (ID: {review.id})")
+        # Save reviews to database in one transaction
+        saved_count = crawler.save_reviews_bulk(review_data_list, restaurant.id)
         
-        logger.info(f"Saved {len(review_data_list)} reviews for {restaurant.name}")
+        logger.info("Saved %s reviews for %s", saved_count, restaurant.name)
     
     except Exception as e:
-        logger.error(f"Error crawling restaurant {url}: {str(e)}")
-    
-    finally:
-        # Close the crawler session
+        logger.error("Error crawling restaurant %s: %s", url, e)
+
+
+def start_crawler(headless: bool) -> SeleniumTripAdvisorCrawler:
+    """Start a crawler that saves through the calling thread's database session"""
+    try:
+        return SeleniumTripAdvisorCrawler(headless=headless, db_session=ScopedSession())
+    except Exception:
+        ScopedSession.remove()
+        raise
+
+
+def close_crawler(crawler: SeleniumTripAdvisorCrawler) -> None:
+    """Close a crawler and the calling thread's database session"""
+    try:
         crawler.close()
+    finally:
+        ScopedSession.remove()
+
+
+async def crawl_worker(url_queue: asyncio.Queue, max_reviews: int, headless: bool) -> None:
+    """Crawl queued restaurants one after another on a single warm browser"""
+    loop = asyncio.get_running_loop()
+    
+    # Selenium drivers and database sessions are not safe to share between
+    # threads, so every worker runs a dedicated crawler on a thread of its own
+    # and keeps both for all the restaurants it takes
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            crawler = await loop.run_in_executor(executor, start_crawler, headless)
+        except Exception as e:
+            logger.error("Error starting crawler: %s", e)
+            return
+        
+        try:
+            while not url_queue.empty():
+                url = url_queue.get_nowait()
+                await loop.run_in_executor(executor, crawl_restaurant, crawler, url, max_reviews)
+        finally:
+            await loop.run_in_executor(executor, close_crawler, crawler)
+
+
+async def crawl_all(urls: List[str], max_reviews: int, headless: bool, concurrency: int) -> None:
+    """Crawl all restaurants with at most `concurrency` browsers open at once"""
+    url_queue: asyncio.Queue = asyncio.Queue()
+    for url in urls:
+        url_queue.put_nowait(url)
+    
+    await asyncio.gather(*(
+        crawl_worker(url_queue, max_reviews, headless) for _ in range(min(concurrency, len(urls)))
+    ))
+    
+    if not url_queue.empty():
+        logger.error("No crawler could be started for %s restaurants", url_queue.qsize())
 
 
 def main():
     """Main entry point for the crawler"""
     parser = setup_argparse()
     args = parser.parse_args()
+    _configure_logging()
     
     # Set demo mode if requested
+    set_demo_mode(args.demo_mode)
     if args.demo_mode:
-        os.environ['DEMO_MODE'] = 'true'
         logger.info("Running in DEMO MODE with mock data")
-    else:
-        os.environ['DEMO_MODE'] = 'false'
     
     # Initialize the database if requested
     if args.init_db:
@@ -113,13 +172,12 @@ def main():
         init_db()
         logger.info("Database initialized successfully")
     
-    # Create crawler
-    crawler = SeleniumTripAdvisorCrawler(headless=args.headless)
-    logger.info(f"Starting to crawl {len(args.urls)} restaurants")
+    logger.info("Starting to crawl %s restaurants", len(args.urls))
     
-    # Crawl each restaurant
-    for url in args.urls:
-        crawl_restaurant(crawler, url, args.max_reviews)
+    # Crawl the restaurants in parallel
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(crawl_all(args.urls, args.max_reviews, args.headless, args.concurrency))
     
     logger.info("Crawling completed successfully")
 
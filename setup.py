@@ -4,17 +4,26 @@ setup(
     name="restaurant-review-crawler",
     version="0.1.0",
     packages=find_packages(),
+    py_modules=["crawl", "selenium_crawl", "debug_crawler"],
     install_requires=[
-        "beautifulsoup4",
-        "requests",
+        "lxml",
+        "orjson",
+        "aiohttp",
+        "aiohttp-client-cache[sqlite]",
+        "httpx[http2]",
         "psycopg2-binary",
         "python-dotenv",
         "scrapy",
         "sqlalchemy",
+        "selectolax",
+        'uvloop; platform_system != "Windows"',
     ],
     entry_points={
         "console_scripts": [
             "restaurant-crawler=src.main:main",
+            "selenium-crawler=selenium_crawl:main",
+            "crawler-debug=debug_crawler:main",
+            "crawler-export=examples.export_data:main",
         ],
     },
     python_requires=">=3.8",
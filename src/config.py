@@ -0,0 +1,20 @@
+"""
+Runtime settings shared by the crawler modules.
+Read flags as attributes of this module (config.DEMO_MODE) rather than
+importing them by name, so changes made with the setters are seen everywhere.
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', '.env'))
+
+# Serve mock data instead of fetching pages
+DEMO_MODE = os.getenv('DEMO_MODE', 'false').lower() == 'true'
+
+
+def set_demo_mode(enabled: bool) -> None:
+    """Turn demo mode on or off for every crawler in this process"""
+    global DEMO_MODE
+    DEMO_MODE = enabled
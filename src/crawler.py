@@ -1,100 +1,272 @@
 import os
+import sqlite3
 import time
+import uuid
+import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Set, Tuple
 from abc import ABC, abstractmethod
+from contextlib import closing
+from urllib.parse import urlsplit
 
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from selectolax.lexbor import LexborHTMLParser
+from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
-from .database import Restaurant, Review, get_db_session, init_db
+from . import config
+from .database import Restaurant, Review, get_db_session, init_db, upsert
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', '.env'))
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'crawler.log')),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger('restaurant_crawler')
 
 # Crawler settings
 USER_AGENT = os.getenv('USER_AGENT')
 REQUEST_DELAY = int(os.getenv('REQUEST_DELAY', 2))
+# Default number of parsed pages each crawler keeps so restaurant and review
+# extraction of the same URL share one fetch
+PAGE_CACHE_SIZE = 4
+# Pooled connections allowed to a single host
+MAX_REQUESTS_PER_HOST = 4
+# Keep-alive connections shared by all hosts, sized so concurrent crawls
+# don't evict and re-handshake each other's connections
+CONNECTION_POOL_SIZE = 100
+# Retry connection errors and transient statuses with exponential backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Pages are kept on disk for HTTP_CACHE_EXPIRE seconds and revalidated with
+# If-None-Match/If-Modified-Since on every request, so an unchanged page costs a
+# 304 instead of a download. HTTP_CACHE_EXPIRE=0 disables the cache
+HTTP_CACHE_EXPIRE = int(os.getenv('HTTP_CACHE_EXPIRE', 30 * 86400))
+HTTP_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'crawler_cache.sqlite')
+
+
+def _review_source_id(platform: str, restaurant_id: int, reviewer_id: str, review_date: datetime) -> str:
+    """Build the source_id that identifies a review across crawls"""
+    return f"{platform}_{restaurant_id}_{reviewer_id}_{int(review_date.timestamp())}"
+
+
+def canonical_host(url: str) -> str:
+    """Host of a URL as one site, so yelp.com and www.yelp.com share a rate limit"""
+    host = urlsplit(url).netloc.lower()
+    if host.startswith('www.'):
+        host = host[len('www.'):]
+    return host
+
+
+def _has_validators(response) -> bool:
+    """Whether the server can answer a later request for this page with a 304"""
+    return 'ETag' in response.headers or 'Last-Modified' in response.headers
+
+
+def create_http_session(cache_path: str = HTTP_CACHE_PATH) -> aiohttp.ClientSession:
+    """Create a pooled, keep-alive HTTP session (cached unless HTTP_CACHE_EXPIRE is 0)"""
+    headers = {
+        'User-Agent': USER_AGENT,
+        'Accept-Language': 'en-US,en;q=0.9',
+    }
+    session_options = {
+        # aiohttp rejects None header values (e.g. an unset USER_AGENT)
+        'headers': {key: value for key, value in headers.items() if value is not None},
+        'connector': aiohttp.TCPConnector(
+            limit=CONNECTION_POOL_SIZE,
+            limit_per_host=MAX_REQUESTS_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        ),
+    }
+    if HTTP_CACHE_EXPIRE > 0:
+        # Worker processes share the cache file; in WAL mode they can read it while
+        # another writes. The mode is stored in the file, so this is a no-op after the first run
+        with closing(sqlite3.connect(cache_path)) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+        # Every request is revalidated, so freshness headers don't matter; a page
+        # without validators would be served unchecked and is not stored at all
+        cache = SQLiteBackend(cache_name=cache_path, expire_after=HTTP_CACHE_EXPIRE, filter_fn=_has_validators)
+        return CachedSession(cache=cache, **session_options)
+    return aiohttp.ClientSession(**session_options)
+
+
+
+def save_reviews(db_session: Session, review_data_list: List[Dict[str, Any]]) -> int:
+    """Save reviews that already carry their restaurant_id in a single transaction"""
+    if not review_data_list:
+        return 0
+    
+    try:
+        # Key by source_id so a repeated review updates rather than duplicates;
+        # one batched upsert can't touch the same row twice
+        reviews_by_source_id = {review_data['source_id']: review_data for review_data in review_data_list}
+        
+        # Insert new reviews and update existing ones in one batched upsert
+        rows = list(reviews_by_source_id.values())
+        db_session.execute(upsert(Review, 'source_id', rows[0]), rows)
+        
+        db_session.commit()
+        return len(reviews_by_source_id)
+    except Exception as e:
+        db_session.rollback()
+        logger.error("Error saving reviews: %s", e)
+        raise
+
+
+class HostThrottle:
+    """Per-host locks and last request times, so each site gets its own
+    REQUEST_DELAY cadence and sites don't wait on each other
+
+    An asyncio lock belongs to the event loop it is first used on, so make one
+    throttle per run and share it between the crawlers of that run.
+    """
+    
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.last_request: Dict[str, float] = {}
+    
+    def lock(self, host: str) -> asyncio.Lock:
+        """Return the host's lock, creating it the first time the host is seen"""
+        lock = self._locks.get(host)
+        if lock is None:
+            lock = self._locks[host] = asyncio.Lock()
+        return lock
 
 
 class BaseCrawler(ABC):
     """Base class for restaurant review crawlers"""
     
-    def __init__(self):
-        self.headers = {
-            'User-Agent': USER_AGENT,
-            'Accept-Language': 'en-US,en;q=0.9',
-        }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        self.db_session = get_db_session()
+    def __init__(
+        self,
+        db_session: Optional[Session] = None,
+        http_session: Optional[aiohttp.ClientSession] = None,
+        page_cache_size: int = PAGE_CACHE_SIZE,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        host_throttle: Optional[HostThrottle] = None,
+    ):
+        # Crawlers can share injected sessions; ones created here are ours to close.
+        # An aiohttp session has to be created inside the running event loop, so
+        # our own is only created on first use
+        self._owns_session = http_session is None
+        self.session = http_session
+        self._owns_db_session = db_session is None
+        self.db_session = get_db_session() if db_session is None else db_session
+        self._page_cache: Dict[str, LexborHTMLParser] = {}
+        self._page_cache_size = page_cache_size
+        # Pages whose last fetch was answered with a 304
+        self._unchanged_urls: Set[str] = set()
+        # Used for the politeness delay and retry backoff
+        self._sleep = sleep
+        # Crawlers running together pass a shared throttle so they take turns per host
+        self.host_throttle = HostThrottle() if host_throttle is None else host_throttle
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the HTTP session, creating it on first use"""
+        if self.session is None:
+            self.session = create_http_session()
+            self._owns_session = True
+        return self.session
+    
+    async def _download(self, url: str) -> Tuple[bytes, bool]:
+        """Download a page with retries, returning the body and whether the server reported it unchanged"""
+        session = self._get_session()
+        # A cached page is only used after a conditional request confirms it is current
+        revalidate = {'refresh': True} if isinstance(session, CachedSession) else {}
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30), **revalidate) as response:
+                    if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                        response.raise_for_status()
+                        return await response.read(), getattr(response, 'from_cache', False)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    raise
+            
+            backoff = RETRY_BACKOFF_FACTOR * 2 ** attempt
+            logger.warning("Retrying %s in %.1fs (attempt %s of %s)", url, backoff, attempt + 1, MAX_RETRIES)
+            await self._sleep(backoff)
     
-    def fetch_page(self, url: str) -> Optional[BeautifulSoup]:
-        """Fetch a page and return BeautifulSoup object"""
+    async def fetch_tree(self, url: str) -> Optional[LexborHTMLParser]:
+        """Fetch a page and return a parsed Lexbor tree, reusing recently fetched pages"""
+        tree = self._page_cache.get(url)
+        if tree is not None:
+            return tree
+        
+        tree = await self._fetch_tree(url)
+        if tree is not None:
+            if len(self._page_cache) >= self._page_cache_size:
+                # Evict the oldest entry
+                self._page_cache.pop(next(iter(self._page_cache)))
+            self._page_cache[url] = tree
+        return tree
+    
+    async def _fetch_tree(self, url: str) -> Optional[LexborHTMLParser]:
+        """Fetch a page and parse it into a Lexbor tree"""
         # Check for demo mode
-        if os.getenv('DEMO_MODE', 'false').lower() == 'true':
+        if config.DEMO_MODE:
             # Return mock data for demonstration purposes
-            logger.info(f"DEMO MODE: Using mock data instead of fetching {url}")
+            logger.info("DEMO MODE: Using mock data instead of fetching %s", url)
             if 'yelp.com' in url:
-                with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests/fixtures/yelp_restaurant.html'), 'r') as f:
-                    return BeautifulSoup(f.read(), 'html.parser')
+                with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests/fixtures/yelp_restaurant.html'), 'rb') as f:
+                    return LexborHTMLParser(f.read())
             elif 'google.com/maps' in url:
                 # Return minimal mock data for Google
                 mock_html = "<html><body><h1>Mock Restaurant</h1><div class='fontDisplayLarge'>4.5</div></body></html>"
-                return BeautifulSoup(mock_html, 'html.parser')
+                return LexborHTMLParser(mock_html)
             elif 'tripadvisor.com' in url:
                 # Return minimal mock data for TripAdvisor
                 mock_html = "<html><body><h1 class='HjBfq'>Mock Restaurant</h1><span class='ZDEqb'>4.5 of 5 bubbles</span></body></html>"
-                return BeautifulSoup(mock_html, 'html.parser')
+                return LexborHTMLParser(mock_html)
             else:
                 mock_html = "<html><body><h1>Generic Restaurant</h1></body></html>"
-                return BeautifulSoup(mock_html, 'html.parser')
+                return LexborHTMLParser(mock_html)
         
         # Real fetching logic
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            time.sleep(REQUEST_DELAY)  # Respect the site by waiting between requests
-            return BeautifulSoup(response.text, 'html.parser')
-        except Exception as e:
-            logger.error(f"Error fetching {url}: {str(e)}")
+            host = canonical_host(url)
+            async with self.host_throttle.lock(host):
+                # Respect the site by waiting REQUEST_DELAY since its last request
+                last_request = self.host_throttle.last_request.get(host)
+                if last_request is not None:
+                    wait = REQUEST_DELAY - (time.monotonic() - last_request)
+                    if wait > 0:
+                        await self._sleep(wait)
+                
+                content, unchanged = await self._download(url)
+                self.host_throttle.last_request[host] = time.monotonic()
+            if unchanged:
+                logger.info("%s is unchanged since it was cached", url)
+                self._unchanged_urls.add(url)
+            else:
+                self._unchanged_urls.discard(url)
+            # Parse in a worker thread so a large page doesn't stall the other fetches
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, LexborHTMLParser, content)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Still failing after the retries in _download
+            logger.error("Error fetching %s: %s", url, e)
             return None
     
+    def page_unchanged(self, url: str) -> bool:
+        """Whether the server reported the page unchanged since it was cached"""
+        return url in self._unchanged_urls
+    
     def save_restaurant(self, restaurant_data: Dict[str, Any]) -> Restaurant:
         """Save restaurant to database"""
         try:
-            # Check if restaurant already exists based on source_url
-            restaurant = self.db_session.query(Restaurant).filter_by(
-                source_url=restaurant_data['source_url']
-            ).first()
-            
-            if restaurant:
-                # Update existing restaurant
-                for key, value in restaurant_data.items():
-                    setattr(restaurant, key, value)
-            else:
-                # Create new restaurant
-                restaurant = Restaurant(**restaurant_data)
-                self.db_session.add(restaurant)
+            # Insert or update in one statement, keyed on source_url
+            stmt = upsert(Restaurant, 'source_url', restaurant_data).returning(Restaurant)
+            restaurant = self.db_session.scalars(
+                stmt, [restaurant_data], execution_options={'populate_existing': True}
+            ).one()
             
             self.db_session.commit()
             return restaurant
         except Exception as e:
             self.db_session.rollback()
-            logger.error(f"Error saving restaurant: {str(e)}")
+            logger.error("Error saving restaurant: %s", e)
             raise
     
     def save_review(self, review_data: Dict[str, Any], restaurant_id: int) -> Review:
@@ -103,71 +275,80 @@ class BaseCrawler(ABC):
             # Add restaurant_id to review data
             review_data['restaurant_id'] = restaurant_id
             
-            # Check if review already exists based on source_id
-            review = self.db_session.query(Review).filter_by(
-                source_id=review_data['source_id']
-            ).first()
-            
-            if review:
-                # Update existing review
-                for key, value in review_data.items():
-                    setattr(review, key, value)
-            else:
-                # Create new review
-                review = Review(**review_data)
-                self.db_session.add(review)
+            # Insert or update in one statement, keyed on source_id
+            stmt = upsert(Review, 'source_id', review_data).returning(Review)
+            review = self.db_session.scalars(
+                stmt, [review_data], execution_options={'populate_existing': True}
+            ).one()
             
             self.db_session.commit()
             return review
         except Exception as e:
             self.db_session.rollback()
-            logger.error(f"Error saving review: {str(e)}")
+            logger.error("Error saving review: %s", e)
             raise
     
-    def close(self):
-        """Close database session"""
-        self.db_session.close()
+    def save_reviews_bulk(self, review_data_list: List[Dict[str, Any]], restaurant_id: int) -> int:
+        """Save a batch of reviews to database in a single transaction"""
+        for review_data in review_data_list:
+            review_data['restaurant_id'] = restaurant_id
+        return save_reviews(self.db_session, review_data_list)
+    
+    async def close(self):
+        """Close the HTTP and database sessions unless they were injected
+
+        Safe to call more than once; a closed crawler opens a new HTTP session
+        if it is used again.
+        """
+        self._page_cache.clear()
+        if self.session is not None:
+            if self._owns_session:
+                await self.session.close()
+            self.session = None
+        if self._owns_db_session:
+            self.db_session.close()
     
     @abstractmethod
-    def crawl_restaurant(self, url: str) -> Dict[str, Any]:
+    async def crawl_restaurant(self, url: str) -> Dict[str, Any]:
         """Crawl a restaurant page and extract information"""
         pass
     
     @abstractmethod
-    def crawl_reviews(self, url: str, restaurant_id: int) -> List[Dict[str, Any]]:
-        """Crawl reviews for a restaurant"""
+    async def crawl_reviews(self, url: str, restaurant_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Crawl up to `limit` reviews for a restaurant (all of them if limit is None)"""
         pass
 
 
 class YelpCrawler(BaseCrawler):
     """Crawler for Yelp restaurant reviews"""
     
-    def crawl_restaurant(self, url: str) -> Dict[str, Any]:
+    async def crawl_restaurant(self, url: str) -> Dict[str, Any]:
         """Crawl a Yelp restaurant page and extract information"""
-        soup = self.fetch_page(url)
-        if not soup:
-            logger.error(f"Failed to fetch restaurant page: {url}")
+        tree = await self.fetch_tree(url)
+        if not tree:
+            logger.error("Failed to fetch restaurant page: %s", url)
             return {}
         
         try:
             # Extract restaurant information
-            name = soup.find('h1').text.strip() if soup.find('h1') else "Unknown"
+            name_element = tree.css_first('h1')
+            name = name_element.text().strip() if name_element else "Unknown"
             
             # Getting address components
-            address_elements = soup.select('[data-testid="bizDetailsAddress"] > p')
-            address = address_elements[0].text.strip() if address_elements else ""
+            address_element = tree.css_first('[data-testid="bizDetailsAddress"] > p')
+            address = address_element.text().strip() if address_element else ""
             
             # Getting rating
-            rating_element = soup.select('[data-testid="rating-stars"]')
-            average_rating = float(rating_element[0].get('aria-label', '0').split()[0]) if rating_element else 0.0
+            rating_element = tree.css_first('[data-testid="rating-stars"]')
+            average_rating = float(rating_element.attributes.get('aria-label', '0').split()[0]) if rating_element else 0.0
             
             # Getting price range
-            price_range_element = soup.select('[data-testid="price-category"] > span:first-child')
-            price_range = price_range_element[0].text.strip() if price_range_element else ""
+            price_range_element = tree.css_first('[data-testid="price-category"] > span:first-child')
+            price_range = price_range_element.text().strip() if price_range_element else ""
             
             # Getting cuisine type
-            cuisine_elements = soup.select('[data-testid="price-category"] > span:not(:first-child) a')
-            cuisine_type = cuisine_elements[0].text.strip() if cuisine_elements else ""
+            cuisine_element = tree.css_first('[data-testid="price-category"] > span:not(:first-child) a')
+            cuisine_type = cuisine_element.text().strip() if cuisine_element else ""
             
             # Parse address for city, state, postal code
             address_parts = address.split(", ")
@@ -177,12 +358,12 @@ class YelpCrawler(BaseCrawler):
             postal_code = state_zip[1] if len(state_zip) > 1 else ""
             
             # Extract phone number
-            phone_element = soup.select('[data-testid="bizPhone"]')
-            phone = phone_element[0].text.strip() if phone_element else ""
+            phone_element = tree.css_first('[data-testid="bizPhone"]')
+            phone = phone_element.text().strip() if phone_element else ""
             
             # Extract website if available
-            website_element = soup.select('[data-testid="bizWebsite"]')
-            website = website_element[0].find('a')['href'] if website_element and website_element[0].find('a') else ""
+            website_link = tree.css_first('[data-testid="bizWebsite"] a')
+            website = website_link.attributes['href'] if website_link else ""
             
             # Create restaurant data dictionary
             restaurant_data = {
@@ -205,14 +386,14 @@ class YelpCrawler(BaseCrawler):
             return restaurant_data
         
         except Exception as e:
-            logger.error(f"Error parsing restaurant data from {url}: {str(e)}")
+            logger.error("Error parsing restaurant data from %s: %s", url, e)
             return {}
     
-    def crawl_reviews(self, url: str, restaurant_id: int) -> List[Dict[str, Any]]:
+    async def crawl_reviews(self, url: str, restaurant_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Crawl Yelp reviews for a restaurant"""
         # Check for demo mode
-        if os.getenv('DEMO_MODE', 'false').lower() == 'true':
-            logger.info(f"DEMO MODE: Using mock reviews data for {url}")
+        if config.DEMO_MODE:
+            logger.info("DEMO MODE: Using mock reviews data for %s", url)
             
             # Create mock reviews
             mock_reviews = []
@@ -226,51 +407,52 @@ class YelpCrawler(BaseCrawler):
                     'reviewer_id': f"user{i+1}",
                     'helpful_count': i,
                     'source_url': url,
-                    'source_id': f"yelp_{restaurant_id}_user{i+1}_{int(review_date.timestamp())}",
+                    'source_id': _review_source_id('yelp', restaurant_id, f"user{i+1}", review_date),
                     'source_platform': 'yelp',
                     'crawl_date': datetime.now()
                 })
             
-            return mock_reviews
+            return mock_reviews[:limit]
         
         # Regular flow
         # Yelp reviews URL format
         reviews_url = f"{url}?sort_by=date_desc"
-        soup = self.fetch_page(reviews_url)
-        if not soup:
-            logger.error(f"Failed to fetch reviews page: {reviews_url}")
+        tree = await self.fetch_tree(reviews_url)
+        if not tree:
+            logger.error("Failed to fetch reviews page: %s", reviews_url)
             return []
         
         reviews = []
         try:
-            # Find review elements
-            review_elements = soup.select('[data-testid="reviews-container"] .review')
+            # Find review elements, skipping any past the limit without parsing them
+            review_elements = tree.css('[data-testid="reviews-container"] .review')[:limit]
             
             for review_element in review_elements:
                 try:
                     # Extract reviewer info
-                    user_element = review_element.select('.user-passport-info a')
-                    reviewer_name = user_element[0].text.strip() if user_element else "Anonymous"
-                    reviewer_id = user_element[0]['href'].split('=')[-1] if user_element and 'href' in user_element[0].attrs else ""
+                    user_element = review_element.css_first('.user-passport-info a')
+                    reviewer_name = user_element.text().strip() if user_element else "Anonymous"
+                    reviewer_id = user_element.attributes.get('href', '').split('=')[-1] if user_element else ""
                     
                     # Extract rating
-                    rating_element = review_element.select('.i-stars')
-                    rating_text = rating_element[0]['aria-label'] if rating_element else "0 star rating"
+                    rating_element = review_element.css_first('.i-stars')
+                    rating_text = rating_element.attributes['aria-label'] if rating_element else "0 star rating"
                     rating = float(rating_text.split()[0])
                     
                     # Extract review date
-                    date_element = review_element.select('.review-date')
-                    review_date_text = date_element[0].text.strip() if date_element else ""
+                    date_element = review_element.css_first('.review-date')
+                    review_date_text = date_element.text().strip() if date_element else ""
                     # Parse date like "10/15/2023"
                     review_date = datetime.strptime(review_date_text, "%m/%d/%Y") if review_date_text else datetime.now()
                     
                     # Extract review text
-                    text_element = review_element.select('.review-content p')
-                    review_text = text_element[0].text.strip() if text_element else ""
+                    text_element = review_element.css_first('.review-content p')
+                    review_text = text_element.text().strip() if text_element else ""
                     
                     # Extract helpful count
-                    helpful_element = review_element.select('.useful-count')
-                    helpful_count = int(helpful_element[0].text.strip()) if helpful_element and helpful_element[0].text.strip().isdigit() else 0
+                    helpful_element = review_element.css_first('.useful-count')
+                    helpful_text = helpful_element.text().strip() if helpful_element else ""
+                    helpful_count = int(helpful_text) if helpful_text.isdigit() else 0
                     
                     # Create review data dictionary
                     review_data = {
@@ -281,30 +463,30 @@ class YelpCrawler(BaseCrawler):
                         'reviewer_id': reviewer_id,
                         'helpful_count': helpful_count,
                         'source_url': reviews_url,
-                        'source_id': f"yelp_{restaurant_id}_{reviewer_id}_{int(review_date.timestamp())}",
+                        'source_id': _review_source_id('yelp', restaurant_id, reviewer_id, review_date),
                         'source_platform': 'yelp',
                         'crawl_date': datetime.now()
                     }
                     
                     reviews.append(review_data)
                 except Exception as e:
-                    logger.error(f"Error parsing review: {str(e)}")
+                    logger.error("Error parsing review: %s", e)
             
             return reviews
         
         except Exception as e:
-            logger.error(f"Error parsing reviews from {reviews_url}: {str(e)}")
+            logger.error("Error parsing reviews from %s: %s", reviews_url, e)
             return []
 
 
 class GoogleMapsCrawler(BaseCrawler):
     """Crawler for Google Maps restaurant reviews"""
     
-    def crawl_restaurant(self, url: str) -> Dict[str, Any]:
+    async def crawl_restaurant(self, url: str) -> Dict[str, Any]:
         """Crawl a Google Maps restaurant page and extract information"""
-        soup = self.fetch_page(url)
-        if not soup:
-            logger.error(f"Failed to fetch restaurant page: {url}")
+        tree = await self.fetch_tree(url)
+        if not tree:
+            logger.error("Failed to fetch restaurant page: %s", url)
             return {}
         
         try:
@@ -313,32 +495,37 @@ class GoogleMapsCrawler(BaseCrawler):
             # This is a simplified implementation
             
             # Extract name from h1
-            name_element = soup.find('h1')
-            name = name_element.text.strip() if name_element else "Unknown"
+            name_element = tree.css_first('h1')
+            name = name_element.text().strip() if name_element else "Unknown"
             
             # Extract address
-            address_element = soup.select('button[data-item-id="address"]')
-            address = address_element[0].text.strip() if address_element else ""
+            address_element = tree.css_first('button[data-item-id="address"]')
+            address = address_element.text().strip() if address_element else ""
             
             # Extract rating
-            rating_element = soup.select('div.fontDisplayLarge')
-            average_rating = float(rating_element[0].text.replace(',', '.')) if rating_element else 0.0
+            rating_element = tree.css_first('div.fontDisplayLarge')
+            average_rating = float(rating_element.text().replace(',', '.')) if rating_element else 0.0
             
             # Extract price range
-            price_element = soup.select('span:contains("$")') 
-            price_range = price_element[0].text.strip() if price_element else ""
+            # Lexbor has no :contains(), so scan the spans for the first one with a "$"
+            price_range = ""
+            for span in tree.css('span'):
+                span_text = span.text()
+                if '$' in span_text:
+                    price_range = span_text.strip()
+                    break
             
             # Extract cuisine type
-            cuisine_element = soup.select('.fontBodyMedium > span > span > span')
-            cuisine_type = cuisine_element[0].text.strip() if cuisine_element else ""
+            cuisine_element = tree.css_first('.fontBodyMedium > span > span > span')
+            cuisine_type = cuisine_element.text().strip() if cuisine_element else ""
             
             # Extract phone
-            phone_element = soup.select('button[data-item-id="phone:tel"]')
-            phone = phone_element[0].text.strip() if phone_element else ""
+            phone_element = tree.css_first('button[data-item-id="phone:tel"]')
+            phone = phone_element.text().strip() if phone_element else ""
             
             # Extract website
-            website_element = soup.select('a[data-item-id="authority"]')
-            website = website_element[0]['href'] if website_element and 'href' in website_element[0].attrs else ""
+            website_element = tree.css_first('a[data-item-id="authority"]')
+            website = website_element.attributes.get('href', '') if website_element else ""
             
             # Parse address components
             address_parts = address.split(", ")
@@ -368,14 +555,14 @@ class GoogleMapsCrawler(BaseCrawler):
             return restaurant_data
         
         except Exception as e:
-            logger.error(f"Error parsing restaurant data from {url}: {str(e)}")
+            logger.error("Error parsing restaurant data from %s: %s", url, e)
             return {}
     
-    def crawl_reviews(self, url: str, restaurant_id: int) -> List[Dict[str, Any]]:
+    async def crawl_reviews(self, url: str, restaurant_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Crawl Google Maps reviews for a restaurant"""
         # Check for demo mode
-        if os.getenv('DEMO_MODE', 'false').lower() == 'true':
-            logger.info(f"DEMO MODE: Using mock reviews data for {url}")
+        if config.DEMO_MODE:
+            logger.info("DEMO MODE: Using mock reviews data for %s", url)
             
             # Create mock reviews
             mock_reviews = []
@@ -389,48 +576,48 @@ class GoogleMapsCrawler(BaseCrawler):
                     'reviewer_id': f"guser{i+1}",
                     'helpful_count': i * 2,
                     'source_url': url,
-                    'source_id': f"google_{restaurant_id}_guser{i+1}_{int(review_date.timestamp())}",
+                    'source_id': _review_source_id('google', restaurant_id, f"guser{i+1}", review_date),
                     'source_platform': 'google',
                     'crawl_date': datetime.now()
                 })
             
-            return mock_reviews
+            return mock_reviews[:limit]
             
         # Google Maps reviews are loaded dynamically, this is a simplified implementation
         # For a real application, you might need to use Selenium to interact with the page
         
-        soup = self.fetch_page(url)
-        if not soup:
-            logger.error(f"Failed to fetch reviews page: {url}")
+        tree = await self.fetch_tree(url)
+        if not tree:
+            logger.error("Failed to fetch reviews page: %s", url)
             return []
         
         reviews = []
         try:
             # Find review elements
-            review_elements = soup.select('.jftiEf')
+            review_elements = tree.css('.jftiEf')[:limit]
             
             for review_element in review_elements:
                 try:
                     # Extract reviewer info
-                    user_element = review_element.select('.d4r55')
-                    reviewer_name = user_element[0].text.strip() if user_element else "Anonymous"
+                    user_element = review_element.css_first('.d4r55')
+                    reviewer_name = user_element.text().strip() if user_element else "Anonymous"
                     
                     # Extract reviewer ID (may not be directly available)
                     reviewer_id = ""  # Would need additional processing to extract this
                     
                     # Extract rating
-                    rating_element = review_element.select('.kvMYJc')
-                    rating = len(rating_element[0].select('.wzN8Ac')) if rating_element else 0
+                    rating_element = review_element.css_first('.kvMYJc')
+                    rating = len(rating_element.css('.wzN8Ac')) if rating_element else 0
                     
                     # Extract review date
-                    date_element = review_element.select('.rsqaWe')
-                    review_date_text = date_element[0].text.strip() if date_element else ""
+                    date_element = review_element.css_first('.rsqaWe')
+                    review_date_text = date_element.text().strip() if date_element else ""
                     # Convert relative date to actual date (simplified)
                     review_date = datetime.now()  # Would need more complex parsing for actual date
                     
                     # Extract review text
-                    text_element = review_element.select('.wiI7pd')
-                    review_text = text_element[0].text.strip() if text_element else ""
+                    text_element = review_element.css_first('.wiI7pd')
+                    review_text = text_element.text().strip() if text_element else ""
                     
                     # Create review data dictionary
                     review_data = {
@@ -441,61 +628,67 @@ class GoogleMapsCrawler(BaseCrawler):
                         'reviewer_id': reviewer_id,
                         'helpful_count': 0,  # Google doesn't show helpful count directly
                         'source_url': url,
-                        'source_id': f"google_{restaurant_id}_{hash(reviewer_name + review_text)}",
+                        # hash() is salted per process, so it can't identify a review across crawls
+                        'source_id': f"google_{restaurant_id}_{uuid.uuid5(uuid.NAMESPACE_URL, f'{reviewer_name}|{review_text}').hex}",
                         'source_platform': 'google',
                         'crawl_date': datetime.now()
                     }
                     
                     reviews.append(review_data)
                 except Exception as e:
-                    logger.error(f"Error parsing review: {str(e)}")
+                    logger.error("Error parsing review: %s", e)
             
             return reviews
         
         except Exception as e:
-            logger.error(f"Error parsing reviews from {url}: {str(e)}")
+            logger.error("Error parsing reviews from %s: %s", url, e)
             return []
 
 
 class TripAdvisorCrawler(BaseCrawler):
     """Crawler for TripAdvisor restaurant reviews"""
     
-    def crawl_restaurant(self, url: str) -> Dict[str, Any]:
+    async def crawl_restaurant(self, url: str) -> Dict[str, Any]:
         """Crawl a TripAdvisor restaurant page and extract information"""
-        soup = self.fetch_page(url)
-        if not soup:
-            logger.error(f"Failed to fetch restaurant page: {url}")
+        tree = await self.fetch_tree(url)
+        if not tree:
+            logger.error("Failed to fetch restaurant page: %s", url)
             return {}
         
         try:
             # Extract restaurant information
-            name_element = soup.select('h1.HjBfq')
-            name = name_element[0].text.strip() if name_element else "Unknown"
+            name_element = tree.css_first('h1.HjBfq')
+            name = name_element.text().strip() if name_element else "Unknown"
             
             # Extract address
-            address_element = soup.select('a.AYHFM')
-            address = address_element[0].text.strip() if address_element else ""
+            address_element = tree.css_first('a.AYHFM')
+            address = address_element.text().strip() if address_element else ""
             
             # Extract rating
-            rating_element = soup.select('span.ZDEqb')
-            rating_text = rating_element[0].text.strip() if rating_element else "0.0"
+            rating_element = tree.css_first('span.ZDEqb')
+            rating_text = rating_element.text().strip() if rating_element else "0.0"
             average_rating = float(rating_text.split(' ')[0].replace(',', '.')) if rating_text else 0.0
             
             # Extract price range
-            price_element = soup.select('a.dlMOJ[data-param="trating"]')
-            price_range = price_element[0].text.strip() if price_element else ""
+            price_element = tree.css_first('a.dlMOJ[data-param="trating"]')
+            price_range = price_element.text().strip() if price_element else ""
             
             # Extract cuisine type
-            cuisine_element = soup.select('a.dlMOJ[data-param="cuisine"]')
-            cuisine_type = cuisine_element[0].text.strip() if cuisine_element else ""
+            cuisine_element = tree.css_first('a.dlMOJ[data-param="cuisine"]')
+            cuisine_type = cuisine_element.text().strip() if cuisine_element else ""
             
             # Extract phone
-            phone_element = soup.select('span.AYHFM:contains("Phone")')
-            phone = phone_element[0].next_sibling.text.strip() if phone_element else ""
+            # Lexbor has no :contains(), so find the "Phone" label by hand
+            phone = ""
+            for span in tree.css('span.AYHFM'):
+                if 'Phone' in span.text():
+                    phone_node = span.next
+                    phone = phone_node.text().strip() if phone_node else ""
+                    break
             
             # Extract website
-            website_element = soup.select('a.YnKZo')
-            website = website_element[0]['href'] if website_element and 'href' in website_element[0].attrs else ""
+            website_element = tree.css_first('a.YnKZo')
+            website = website_element.attributes.get('href', '') if website_element else ""
             
             # Parse address components (simplified)
             address_parts = address.split(", ")
@@ -525,14 +718,14 @@ class TripAdvisorCrawler(BaseCrawler):
             return restaurant_data
         
         except Exception as e:
-            logger.error(f"Error parsing restaurant data from {url}: {str(e)}")
+            logger.error("Error parsing restaurant data from %s: %s", url, e)
             return {}
     
-    def crawl_reviews(self, url: str, restaurant_id: int) -> List[Dict[str, Any]]:
+    async def crawl_reviews(self, url: str, restaurant_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """Crawl TripAdvisor reviews for a restaurant"""
         # Check for demo mode
-        if os.getenv('DEMO_MODE', 'false').lower() == 'true':
-            logger.info(f"DEMO MODE: Using mock reviews data for {url}")
+        if config.DEMO_MODE:
+            logger.info("DEMO MODE: Using mock reviews data for %s", url)
             
             # Create mock reviews
             mock_reviews = []
@@ -546,43 +739,43 @@ class TripAdvisorCrawler(BaseCrawler):
                     'reviewer_id': f"tauser{i+1}",
                     'helpful_count': i * 3,
                     'source_url': url,
-                    'source_id': f"tripadvisor_{restaurant_id}_tauser{i+1}_{int(review_date.timestamp())}",
+                    'source_id': _review_source_id('tripadvisor', restaurant_id, f"tauser{i+1}", review_date),
                     'source_platform': 'tripadvisor',
                     'crawl_date': datetime.now()
                 })
             
-            return mock_reviews
+            return mock_reviews[:limit]
         
         # TripAdvisor reviews URL format
         reviews_url = f"{url.split('Reviews-')[0]}Reviews-or10-{url.split('Reviews-')[1]}"
-        soup = self.fetch_page(reviews_url)
-        if not soup:
-            logger.error(f"Failed to fetch reviews page: {reviews_url}")
+        tree = await self.fetch_tree(reviews_url)
+        if not tree:
+            logger.error("Failed to fetch reviews page: %s", reviews_url)
             return []
         
         reviews = []
         try:
             # Find review elements
-            review_elements = soup.select('.review-container')
+            review_elements = tree.css('.review-container')[:limit]
             
             for review_element in review_elements:
                 try:
                     # Extract reviewer info
-                    user_element = review_element.select('.info_text div:first-child')
-                    reviewer_name = user_element[0].text.strip() if user_element else "Anonymous"
+                    user_element = review_element.css_first('.info_text div:first-child')
+                    reviewer_name = user_element.text().strip() if user_element else "Anonymous"
                     
                     # Extract reviewer ID 
-                    reviewer_profile = review_element.select('.memberOverlayLink')
-                    reviewer_id = reviewer_profile[0]['id'] if reviewer_profile and 'id' in reviewer_profile[0].attrs else ""
+                    reviewer_profile = review_element.css_first('.memberOverlayLink')
+                    reviewer_id = reviewer_profile.attributes.get('id', '') if reviewer_profile else ""
                     
                     # Extract rating
-                    rating_element = review_element.select('.ui_bubble_rating')
-                    rating_class = rating_element[0]['class'][-1] if rating_element and 'class' in rating_element[0].attrs else "bubble_00"
+                    rating_element = review_element.css_first('.ui_bubble_rating')
+                    rating_class = rating_element.attributes['class'].split()[-1] if rating_element else "bubble_00"
                     rating = float(rating_class.replace('bubble_', '')) / 10 if rating_class else 0.0
                     
                     # Extract review date
-                    date_element = review_element.select('.ratingDate')
-                    review_date_text = date_element[0]['title'] if date_element and 'title' in date_element[0].attrs else ""
+                    date_element = review_element.css_first('.ratingDate')
+                    review_date_text = date_element.attributes.get('title', '') if date_element else ""
                     # Parse date like "October 15, 2023"
                     try:
                         review_date = datetime.strptime(review_date_text, "%B %d, %Y") if review_date_text else datetime.now()
@@ -590,13 +783,14 @@ class TripAdvisorCrawler(BaseCrawler):
                         review_date = datetime.now()
                     
                     # Extract review text
-                    text_element = review_element.select('.prw_reviews_text_summary_hsx')
-                    review_text = text_element[0].get_text(strip=True) if text_element else ""
+                    text_element = review_element.css_first('.prw_reviews_text_summary_hsx')
+                    review_text = text_element.text(strip=True) if text_element else ""
                     
                     # Extract helpful count
-                    helpful_element = review_element.select('.numHelp')
-                    helpful_text = helpful_element[0].text.strip() if helpful_element else "0"
-                    helpful_count = int(helpful_text.split()[0]) if helpful_text and helpful_text.split()[0].isdigit() else 0
+                    helpful_element = review_element.css_first('.numHelp')
+                    helpful_text = helpful_element.text().strip() if helpful_element else "0"
+                    helpful_words = helpful_text.split()
+                    helpful_count = int(helpful_words[0]) if helpful_words and helpful_words[0].isdigit() else 0
                     
                     # Create review data dictionary
                     review_data = {
@@ -607,17 +801,17 @@ class TripAdvisorCrawler(BaseCrawler):
                         'reviewer_id': reviewer_id,
                         'helpful_count': helpful_count,
                         'source_url': reviews_url,
-                        'source_id': f"tripadvisor_{restaurant_id}_{reviewer_id}_{int(review_date.timestamp())}",
+                        'source_id': _review_source_id('tripadvisor', restaurant_id, reviewer_id, review_date),
                         'source_platform': 'tripadvisor',
                         'crawl_date': datetime.now()
                     }
                     
                     reviews.append(review_data)
                 except Exception as e:
-                    logger.error(f"Error parsing review: {str(e)}")
+                    logger.error("Error parsing review: %s", e)
             
             return reviews
         
         except Exception as e:
-            logger.error(f"Error parsing reviews from {reviews_url}: {str(e)}")
+            logger.error("Error parsing reviews from %s: %s", reviews_url, e)
             return []
@@ -1,8 +1,11 @@
 import os
+from contextlib import contextmanager
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import scoped_session, sessionmaker, relationship
+from sqlalchemy.dialects import postgresql, sqlite
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', '.env'))
@@ -25,8 +28,26 @@ else:
     DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # Create SQLAlchemy engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if USE_SQLITE:
+    engine = create_engine(DATABASE_URL)
+else:
+    # Let psycopg2 batch executemany() UPDATEs as well as INSERTs, and keep
+    # enough pooled connections for concurrent crawlers to reuse instead of
+    # reconnecting; pre-ping/recycle drop connections the server has closed
+    engine = create_engine(
+        DATABASE_URL,
+        executemany_mode='values_plus_batch',
+        pool_size=16,
+        max_overflow=32,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+# Keep attributes loaded after commit so callers reading e.g. restaurant.name
+# right after saving don't trigger a refresh SELECT
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+# One session per thread, created on first use; ScopedSession.remove() closes
+# the calling thread's session
+ScopedSession = scoped_session(SessionLocal)
 Base = declarative_base()
 
 
@@ -46,7 +67,7 @@ class Restaurant(Base):
     average_rating = Column(Float)
     source_url = Column(String(255), unique=True)
     source_id = Column(String(100))
-    source_platform = Column(String(50))  # e.g., 'yelp', 'google', 'tripadvisor'
+    source_platform = Column(String(50), index=True)  # e.g., 'yelp', 'google', 'tripadvisor'
     last_updated = Column(DateTime)
 
     # Relationship with reviews
@@ -72,16 +93,48 @@ class Review(Base):
     # Relationship with restaurant
     restaurant = relationship("Restaurant", back_populates="reviews")
 
+    __table_args__ = (
+        # Serves "latest reviews for a restaurant" and, through its leading
+        # column, plain lookups/joins by restaurant_id
+        Index('ix_review_restaurant_date', restaurant_id, review_date.desc()),
+    )
+
 
 def init_db():
     """Initialize the database by creating all tables"""
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes introduced
+    # after those tables were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def upsert(model, index_column: str, columns):
+    """Build an INSERT ... ON CONFLICT DO UPDATE of the given columns, keyed on index_column"""
+    # Both backends support ON CONFLICT, but through dialect-specific insert()
+    insert = sqlite.insert if USE_SQLITE else postgresql.insert
+    stmt = insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=[index_column],
+        set_={name: stmt.excluded[name] for name in columns if name not in ('id', index_column)},
+    )
 
 
 def get_db_session():
-    """Get a database session"""
+    """Get a database session (the caller is responsible for closing it)"""
+    return SessionLocal()
+
+
+@contextmanager
+def db_session_scope():
+    """Provide a session that is committed on success, rolled back on error and always closed"""
     db = SessionLocal()
     try:
-        return db
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
@@ -1,28 +1,76 @@
 #!/usr/bin/env python
 import argparse
+import asyncio
 import logging
+import multiprocessing
 import os
 import sys
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-from dotenv import load_dotenv
+# The crawler and database modules (aiohttp, selectolax, SQLAlchemy) are
+# imported where they are first needed, so `--help` and argument errors
+# return without loading them
+
+logger = logging.getLogger('restaurant_crawler_main')
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+ENV_PATH = PROJECT_ROOT / 'config' / '.env'
+LOG_PATH = PROJECT_ROOT / 'crawler.log'
+
+# Crawler class in src.crawler and display name for each source; classes are
+# looked up by name so the crawler module is only imported once it is needed
+_CRAWLERS = {
+    'yelp': ('YelpCrawler', 'Yelp'),
+    'google': ('GoogleMapsCrawler', 'Google Maps'),
+    'tripadvisor': ('TripAdvisorCrawler', 'TripAdvisor'),
+}
+
+# Query parameters that only record where a link was shared from
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid')
+
+@dataclass(frozen=True)
+class CrawlOptions:
+    """Settings shared by every crawl in a run, passed as one picklable value to worker processes"""
+    source: str
+    max_reviews: int
+    concurrency: int
+    refresh: bool
+
+
+# Crawled reviews are written in batches covering up to this many restaurants,
+# or whatever arrived within WRITE_BATCH_INTERVAL seconds, whichever comes first
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_INTERVAL = 0.5
+# Restaurants whose reviews may wait for the writer before crawls pause
+WRITE_QUEUE_SIZE = 256
 
-from .database import init_db
-from .crawler import YelpCrawler, GoogleMapsCrawler, TripAdvisorCrawler
 
-# Load environment variables
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', '.env'))
+def _log_to_queue(log_queue) -> None:
+    """Route all records of this process through log_queue"""
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'crawler.log')),
+
+def _configure_logging(log_queue) -> QueueListener:
+    """Log to crawler.log and the console from a background listener thread"""
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.FileHandler(LOG_PATH),
         logging.StreamHandler()
     ]
-)
-logger = logging.getLogger('restaurant_crawler_main')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Crawl code only enqueues records; the listener does the disk and console writes
+    _log_to_queue(log_queue)
+    return QueueListener(log_queue, *handlers, respect_handler_level=True)
 
 
 def setup_argparse() -> argparse.ArgumentParser:
@@ -31,7 +79,7 @@ def setup_argparse() -> argparse.ArgumentParser:
     parser.add_argument(
         'source',
         type=str,
-        choices=['yelp', 'google', 'tripadvisor', 'all'],
+        choices=[*_CRAWLERS, 'all'],
         help='Source platform to crawl (yelp, google, tripadvisor, or all)'
     )
     parser.add_argument(
@@ -46,6 +94,23 @@ def setup_argparse() -> argparse.ArgumentParser:
         default=100,
         help='Maximum number of reviews to crawl per restaurant (default: 100)'
     )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=32,
+        help='Maximum number of restaurant crawls to run at once (default: 32)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Maximum number of worker processes; URLs on the same host always share one (default: CPU count)'
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Crawl restaurants again even if they are already in the database (pages are always requested from the site again)'
+    )
     parser.add_argument(
         '--init-db',
         action='store_true',
@@ -54,55 +119,246 @@ def setup_argparse() -> argparse.ArgumentParser:
     return parser
 
 
-def get_crawler(source: str) -> Tuple[List, str]:
+def get_crawler(source: str, db_session, http_session, page_cache_size: int, host_throttle=None) -> Tuple[List, str]:
     """Get the appropriate crawler class based on the source"""
-    if source == 'yelp':
-        return [YelpCrawler()], 'Yelp'
-    elif source == 'google':
-        return [GoogleMapsCrawler()], 'Google Maps'
-    elif source == 'tripadvisor':
-        return [TripAdvisorCrawler()], 'TripAdvisor'
-    elif source == 'all':
-        return [YelpCrawler(), GoogleMapsCrawler(), TripAdvisorCrawler()], 'all platforms'
+    from . import crawler
+    
+    if source == 'all':
+        class_names, source_name = [class_name for class_name, _ in _CRAWLERS.values()], 'all platforms'
     else:
-        logger.error(f"Unknown source: {source}")
-        sys.exit(1)
+        try:
+            class_name, source_name = _CRAWLERS[source]
+        except KeyError:
+            logger.error("Unknown source: %s", source)
+            sys.exit(1)
+        class_names = [class_name]
+    
+    return [
+        getattr(crawler, class_name)(db_session, http_session, page_cache_size, host_throttle=host_throttle)
+        for class_name in class_names
+    ], source_name
 
 
-def crawl_restaurant(crawler, url: str, max_reviews: int) -> None:
-    """Crawl a restaurant and its reviews"""
+async def crawl_restaurant(
+    crawler, url: str, max_reviews: int, write_queue: asyncio.Queue, crawled: Dict[str, int]
+) -> None:
+    """Crawl a restaurant and its reviews, queueing the reviews for the writer
+
+    `crawled` maps the URLs of restaurants already in the database to their IDs.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    
+    # Network errors are retried and logged by the crawler, which then returns no data
     try:
-        logger.info(f"Crawling restaurant: {url}")
-        restaurant_data = crawler.crawl_restaurant(url)
+        logger.info("Crawling restaurant: %s", url)
+        restaurant_data = await crawler.crawl_restaurant(url)
         
         if not restaurant_data:
-            logger.error(f"Failed to extract restaurant data from {url}")
+            logger.error("Failed to extract restaurant data from %s", url)
             return
         
-        # Save restaurant to database
-        restaurant = crawler.save_restaurant(restaurant_data)
-        logger.info(f"Saved restaurant: {restaurant.name} (ID: {restaurant.id})")
+        name = restaurant_data.get('name')
+        restaurant_id = crawled.get(url)
+        if restaurant_id is not None and crawler.page_unchanged(url):
+            # The site answered 304, so the saved restaurant is still current
+            logger.info("Restaurant unchanged since the last crawl: %s (ID: %s)", name, restaurant_id)
+        else:
+            # Save restaurant to database
+            restaurant = crawler.save_restaurant(restaurant_data)
+            restaurant_id = restaurant.id
+            logger.info("Saved restaurant: %s (ID: %s)", name, restaurant_id)
         
         # Crawl reviews
-        logger.info(f"Crawling reviews for restaurant: {restaurant.name}")
-        review_data_list = crawler.crawl_reviews(url, restaurant.id)
+        logger.info("Crawling reviews for restaurant: %s", name)
+        review_data_list = await crawler.crawl_reviews(url, restaurant_id, limit=max_reviews)
         
-        # Limit the number of reviews to save
-        review_data_list = review_data_list[:max_reviews]
-        
-        # Save reviews to database
-        for review_data in review_data_list:
-            review = crawler.save_review(review_data, restaurant.id)
-            logger.debug(f"Saved review from {review.reviewer_name} (ID: {review.id})")
+        # Hand the reviews to the writer and move on to the next crawl
+        if review_data_list:
+            for review_data in review_data_list:
+                review_data['restaurant_id'] = restaurant_id
+            await write_queue.put(review_data_list)
+        logger.info("Queued %s reviews for %s", len(review_data_list), name)
+    
+    except SQLAlchemyError as e:
+        # save_restaurant rolled back, so the shared session is usable for the next crawl
+        logger.error("Database error saving restaurant from %s: %s", url, e)
+    except Exception:
+        # Anything else is a bug in a crawler, so keep the traceback
+        logger.exception("Error crawling restaurant %s", url)
+
+
+async def _run_jobs(jobs: List[Tuple[Any, str]], crawl: Callable[[Any, str], Awaitable[None]], concurrency: int) -> None:
+    """Crawl (crawler, url) jobs with up to `concurrency` workers pulling from a shared queue"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    
+    # Each worker takes the next job as soon as it is free, so a slow platform
+    # or host only ever occupies one worker at a time
+    async def worker() -> None:
+        while not queue.empty():
+            crawler, url = queue.get_nowait()
+            await crawl(crawler, url)
+    
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(jobs)))))
+
+
+async def _next_write_batch(write_queue: asyncio.Queue) -> list:
+    """Wait for queued reviews, then collect what else arrives for the rest of the batch"""
+    loop = asyncio.get_running_loop()
+    batch = [await write_queue.get()]
+    deadline = loop.time() + WRITE_BATCH_INTERVAL
+    while len(batch) < WRITE_BATCH_SIZE and batch[-1] is not None:
+        try:
+            batch.append(await asyncio.wait_for(write_queue.get(), deadline - loop.time()))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+async def _write_reviews(write_queue: asyncio.Queue) -> None:
+    """Save queued review lists in batches until None is queued"""
+    from .crawler import save_reviews
+    from .database import db_session_scope
+    
+    loop = asyncio.get_running_loop()
+    # The writer's session is only used from its own thread, so database round
+    # trips run alongside the fetches instead of stalling the event loop
+    with ThreadPoolExecutor(max_workers=1) as executor, db_session_scope() as db_session:
+        while True:
+            batch = await _next_write_batch(write_queue)
+            finished = batch[-1] is None
+            if finished:
+                batch.pop()
+            
+            if batch:
+                rows = [review_data for review_data_list in batch for review_data in review_data_list]
+                try:
+                    saved_count = await loop.run_in_executor(executor, save_reviews, db_session, rows)
+                    logger.info("Saved %s reviews for %s restaurants", saved_count, len(batch))
+                except Exception:
+                    # Already logged and rolled back; keep draining so crawls never block on a full queue
+                    logger.error("Dropped reviews for %s restaurants", len(batch))
+            
+            if finished:
+                return
+
+
+def _crawled_restaurants(urls: List[str], db_session) -> Dict[str, int]:
+    """Map the URLs whose restaurant is already in the database to the restaurant's ID"""
+    from sqlalchemy import select
+    from .database import Restaurant
+    
+    return dict(db_session.execute(
+        select(Restaurant.source_url, Restaurant.id).where(Restaurant.source_url.in_(urls))
+    ))
+
+
+async def crawl_all(options: CrawlOptions, urls: List[str], db_session) -> None:
+    """Crawl every URL with every crawler, at most `options.concurrency` at once"""
+    from .crawler import PAGE_CACHE_SIZE, HostThrottle, create_http_session
+    
+    # One lookup for the whole batch rather than one per URL and platform
+    crawled = _crawled_restaurants(urls, db_session)
+    if crawled and not options.refresh:
+        logger.info("Skipping %s restaurants already in the database (use --refresh to crawl them again)", len(crawled))
+        urls = [url for url in urls if url not in crawled]
+        if not urls:
+            return
+    
+    # One pooled HTTP session for all crawlers, so connections are reused across platforms
+    async with create_http_session() as http_session:
+        # Up to `concurrency` crawls interleave on each crawler; keep a parsed page
+        # for each of them so reviews reuse the page their restaurant came from
+        page_cache_size = max(PAGE_CACHE_SIZE, options.concurrency)
+        # All crawlers of this run take turns on the same per-host schedule
+        crawlers, source_name = get_crawler(options.source, db_session, http_session, page_cache_size, HostThrottle())
+        logger.info("Starting to crawl %s for %s restaurants", source_name, len(urls))
         
-        logger.info(f"Saved {len(review_data_list)} reviews for {restaurant.name}")
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = asyncio.create_task(_write_reviews(write_queue))
+        jobs = [(crawler, url) for url in urls for crawler in crawlers]
+        crawl = partial(crawl_restaurant, max_reviews=options.max_reviews, write_queue=write_queue, crawled=crawled)
+        crawls = asyncio.create_task(_run_jobs(jobs, crawl, options.concurrency))
+        try:
+            await asyncio.wait({crawls, writer}, return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                # The writer only returns once None is queued, so it has failed; stop the
+                # crawls instead of leaving them blocked on a full queue, and raise its error
+                crawls.cancel()
+                await asyncio.wait({crawls})
+                writer.result()
+            await crawls
+        finally:
+            crawls.cancel()
+            if not writer.done():
+                # Let the writer save what is still queued before shutting down; if it
+                # fails meanwhile nothing takes from the queue, so stop waiting to queue None
+                stop = asyncio.ensure_future(write_queue.put(None))
+                await asyncio.wait({stop, writer}, return_when=asyncio.FIRST_COMPLETED)
+                stop.cancel()
+                await writer
+            
+            # The crawlers are shared by all tasks, so close them once at the end
+            for crawler in crawlers:
+                await crawler.close()
+
+
+def _canonical_url(url: str) -> str:
+    """Key that is equal for URLs of the same page written differently"""
+    from .crawler import canonical_host
     
-    except Exception as e:
-        logger.error(f"Error crawling restaurant {url}: {str(e)}")
+    parts = urlsplit(url)
+    # The query can select the page (e.g. a Google Maps cid), so only tracking
+    # parameters are dropped and the rest are put in a fixed order
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith(TRACKING_PARAMS)
+    ))
+    return urlunsplit((parts.scheme.lower(), canonical_host(url), parts.path.rstrip('/'), query, ''))
+
+
+def _dedupe_urls(urls: List[str]) -> List[str]:
+    """Keep the first of each group of URLs for the same page, as it was given"""
+    urls_by_page: Dict[str, str] = {}
+    for url in urls:
+        urls_by_page.setdefault(_canonical_url(url), url)
     
-    finally:
-        # Close the crawler session
-        crawler.close()
+    unique_urls = list(urls_by_page.values())
+    if len(unique_urls) < len(urls):
+        logger.info("Deduplicated %s URLs to %s unique pages", len(urls), len(unique_urls))
+    return unique_urls
+
+
+def _shard_urls_by_host(urls: List[str], shards: int) -> List[List[str]]:
+    """Split URLs into at most `shards` groups, keeping each host within one group"""
+    from .crawler import canonical_host
+    
+    # Keyed like the crawler's per-host rate limit, so www.yelp.com and yelp.com stay together
+    urls_by_host: Dict[str, List[str]] = {}
+    for url in urls:
+        urls_by_host.setdefault(canonical_host(url), []).append(url)
+    
+    groups: List[List[str]] = [[] for _ in range(max(1, min(shards, len(urls_by_host))))]
+    # Place the busiest hosts first, each into the currently smallest group
+    for host_urls in sorted(urls_by_host.values(), key=len, reverse=True):
+        min(groups, key=len).extend(host_urls)
+    return groups
+
+
+def _crawl_shard(options: CrawlOptions, urls: List[str]) -> None:
+    """Crawl a group of URLs on its own event loop and database session"""
+    from .database import db_session_scope
+    
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:  # uvloop is not available on Windows
+        pass
+    
+    # All crawlers share one database session for the whole run
+    with db_session_scope() as db_session:
+        asyncio.run(crawl_all(options, urls, db_session))
 
 
 def main():
@@ -110,22 +366,47 @@ def main():
     parser = setup_argparse()
     args = parser.parse_args()
     
-    # Initialize the database if requested
-    if args.init_db:
-        logger.info("Initializing database...")
-        init_db()
-        logger.info("Database initialized successfully")
-    
-    # Get the crawler class
-    crawlers, source_name = get_crawler(args.source)
-    logger.info(f"Starting to crawl {source_name} for {len(args.urls)} restaurants")
+    from dotenv import load_dotenv
     
-    # Crawl each restaurant
-    for url in args.urls:
-        for crawler in crawlers:
-            crawl_restaurant(crawler, url, args.max_reviews)
+    # Load environment variables
+    load_dotenv(ENV_PATH)
     
-    logger.info("Crawling completed successfully")
+    # Workers are spawned rather than forked: forking after the log listener
+    # thread has started can leave a child holding a lock that thread owned
+    mp_context = multiprocessing.get_context('spawn')
+    # A process-safe queue, so worker processes log through the same listener
+    log_queue = mp_context.Queue(-1)
+    log_listener = _configure_logging(log_queue)
+    log_listener.start()
+    try:
+        # Crawl each page once, however many times or ways it was passed
+        args.urls = _dedupe_urls(args.urls)
+        
+        # Initialize the database if requested
+        if args.init_db:
+            from .database import init_db
+            
+            logger.info("Initializing database...")
+            init_db()
+            logger.info("Database initialized successfully")
+        
+        # Crawl all restaurants concurrently. Parsing is CPU-bound, so spread hosts
+        # over worker processes; a host never spans two processes, which keeps its
+        # REQUEST_DELAY rate limit intact
+        options = CrawlOptions(args.source, args.max_reviews, args.concurrency, args.refresh)
+        shards = _shard_urls_by_host(args.urls, args.workers)
+        if len(shards) == 1:
+            _crawl_shard(options, args.urls)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=len(shards), mp_context=mp_context, initializer=_log_to_queue, initargs=(log_queue,)
+            ) as executor:
+                list(executor.map(partial(_crawl_shard, options), shards))
+        
+        logger.info("Crawling completed successfully")
+    finally:
+        # Flush whatever is still queued before exiting
+        log_listener.stop()
 
 
 if __name__ == "__main__":
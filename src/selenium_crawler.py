@@ -4,45 +4,170 @@ This module provides a crawler that can handle JavaScript-rendered content
 for better scraping of modern websites.
 """
 import os
-import time
+import re
 import logging
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
-import json
 
+from sqlalchemy.orm import Session
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
+import lxml.html
+from selectolax.lexbor import LexborHTMLParser
+from lxml import etree
+import orjson
+import httpx
 
-from .database import Restaurant, Review, get_db_session
+from . import config
+from .crawler import save_reviews
+from .database import Restaurant, Review, get_db_session, upsert
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'crawler.log')),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger('selenium_crawler')
 
 # Crawler settings
 REQUEST_DELAY = int(os.getenv('REQUEST_DELAY', 2))
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Requests the crawler never needs for text reviews; blocked over CDP so
+# pages load without images, media, fonts, stylesheets or trackers
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.mp4",
+    "*.woff*", "*.ttf", "*.css", "*/analytics/*", "*/tracking/*",
+]
+
+# What has to be in the DOM before a page is worth reading
+PAGE_READY_SELECTOR = '[data-automation="reviewCard"], .review-container, h1'
+REVIEWS_READY_SELECTOR = '[data-automation="reviewCard"], .review-container, div[data-test-target*="review"]'
+
+# Patterns used on every page, compiled once
+RATING_RE = re.compile(r'rated (\d+\.\d+) of 5')
+MONTH_RE = re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\b')
+HEADING_XPATH = etree.XPath('//h1')
+JSON_LD_XPATH = etree.XPath('//script[@type="application/ld+json"]/text()', smart_strings=False)
+META_DESCRIPTION_XPATH = etree.XPath('//meta[@name="description"]/@content')
+
+# Review date formats, e.g. "October 15, 2023", "October 2023" and "Oct 2023"
+DATE_FORMAT = "%B %d, %Y"
+MONTH_DATE_FORMAT = "%B %Y"
+SHORT_MONTH_DATE_FORMAT = "%b %Y"
+
+# Counts the collapsed "Read more" toggles and, when arguments[0] is true,
+# clicks them all in the same call
+READ_MORE_SCRIPT = """
+const buttons = [...document.querySelectorAll('span')].filter(span =>
+    [...span.childNodes].some(node => node.nodeType === Node.TEXT_NODE && node.data.includes('Read more')));
+if (arguments[0]) {
+    buttons.forEach(button => button.click());
+}
+return buttons.length;
+"""
+
+# HTML of the first reviews section that holds a rating widget (or the whole
+# body), so the page-source fallback doesn't transfer and parse the full page
+REVIEWS_HTML_SCRIPT = """
+const section = [...document.querySelectorAll('[id*="REVIEWS"], [class*="reviews"]')]
+    .find(el => el.querySelector('span[class*="bubble"], span[class*="rating"]'));
+return (section || document.body).outerHTML;
+"""
+
+# Review card fields read from the first selector that matches, in order
+REVIEWER_SELECTORS = ['.info_text div:first-child', '[data-automation="reviewerName"]']
+REVIEW_TEXT_SELECTORS = ['.prw_reviews_text_summary_hsx', '[data-automation="reviewText"]']
+
+# Finds the review cards and reads the fields crawl_reviews needs from each
+# one in a single call. The strategies run in order and the first one that
+# matches wins, as the separate find_elements fallbacks used to. Takes
+# REVIEWER_SELECTORS and REVIEW_TEXT_SELECTORS as arguments. A field is null
+# when its element is missing and '' when an attribute is empty, so the
+# Python side can apply the same fallbacks as before
+REVIEWS_SCRIPT = """
+const [reviewerSelectors, reviewTextSelectors] = arguments;
+const find = (card, selector) => card.querySelector(selector);
+const text = (card, selector) => { const el = find(card, selector); return el ? el.innerText : null; };
+const firstText = (card, selectors) => {
+    for (const selector of selectors) {
+        const el = find(card, selector);
+        if (el) {
+            return el.innerText;
+        }
+    }
+    return null;
+};
+const attr = (card, selector, name) => { const el = find(card, selector); return el ? (el.getAttribute(name) || '') : null; };
+const all = selector => [...document.querySelectorAll(selector)];
+// A div with a rating widget and a paragraph of more than 30 characters
+const looksLikeReview = div =>
+    div.querySelector('span[class*="bubble"], span[class*="rating"]') &&
+    [...div.querySelectorAll('p')].some(p => {
+        const node = [...p.childNodes].find(child => child.nodeType === Node.TEXT_NODE);
+        return node && node.data.length > 30;
+    });
+const strategies = [
+    ['data-automation attribute', () => all('[data-automation="reviewCard"]')],
+    ['review-container class', () => all('.review-container')],
+    ['data-test-target attribute', () => all('div[data-test-target*="review"]')],
+    ['review headers', () => all('div[class*="review-header"]').map(header => header.parentElement).filter(Boolean)],
+    ['review-like divs', () => {
+        const section = document.querySelector('div[id*="REVIEWS"], div[class*="reviews"]');
+        return section ? [...section.querySelectorAll('div')].filter(looksLikeReview) : [];
+    }],
+];
+const readFields = card => {
+    const ratingDate = find(card, '.ratingDate');
+    return {
+        reviewer_name: firstText(card, reviewerSelectors),
+        bubble_class: attr(card, 'span.ui_bubble_rating', 'class'),
+        rating_label: attr(card, '[data-automation="reviewRating"]', 'aria-label'),
+        rating_date: ratingDate ? (ratingDate.getAttribute('title') || ratingDate.innerText) : null,
+        automation_date: text(card, '[data-automation="reviewDate"]'),
+        review_text: firstText(card, reviewTextSelectors),
+        card_text: card.innerText,
+    };
+};
+for (const [strategy, findCards] of strategies) {
+    const cards = findCards();
+    if (cards.length) {
+        return {strategy: strategy, reviews: cards.map(readFields)};
+    }
+}
+return {strategy: null, reviews: []};
+"""
+
+
+@lru_cache(maxsize=512)
+def _parse_date(date_text: str, date_format: str) -> datetime:
+    """Parse a review date; reviews on a page often share the same date string"""
+    return datetime.strptime(date_text, date_format)
+
+
+@lru_cache(maxsize=None)
+def _chromedriver_path() -> str:
+    """Locate (downloading if needed) chromedriver once per process"""
+    return ChromeDriverManager().install()
 
 
 class SeleniumTripAdvisorCrawler:
     """Crawler for TripAdvisor restaurant reviews using Selenium."""
     
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, db_session: Optional[Session] = None):
         """Initialize the Selenium crawler."""
-        self.db_session = get_db_session()
+        # An injected session belongs to the caller; one created here is ours to close
+        self._owns_db_session = db_session is None
+        self.db_session = get_db_session() if db_session is None else db_session
+        # Plain HTTP client for pages that don't need JavaScript
+        self.http_client = httpx.Client(
+            http2=True,
+            headers={'User-Agent': USER_AGENT, 'Accept-Language': 'en-US,en;q=0.9'},
+            timeout=30,
+            follow_redirects=True,
+        )
         self.driver = self._setup_driver(headless)
     
     def _setup_driver(self, headless=True):
@@ -58,100 +183,63 @@ class SeleniumTripAdvisorCrawler:
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option("useAutomationExtension", False)
-        chrome_options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.default_content_setting_values.notifications": 2,
+        })
+        chrome_options.add_argument(f'--user-agent={USER_AGENT}')
         
-        # Use ChromeDriverManager to automatically download the appropriate driver
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        # Use ChromeDriverManager to automatically download the appropriate driver,
+        # resolved once and shared by every crawler in this process
+        service = Service(_chromedriver_path())
+        # Keep one HTTP connection to chromedriver open for every command instead
+        # of reconnecting per find_element/get_attribute call
+        driver = webdriver.Chrome(service=service, options=chrome_options, keep_alive=True)
         
         # Set navigator.webdriver to undefined
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         
+        # Skip downloading resources that carry no review text
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+        
         return driver
     
+    def _wait_until(self, condition, description: str):
+        """Wait until condition(driver) holds, at most REQUEST_DELAY * 3 seconds."""
+        try:
+            WebDriverWait(self.driver, REQUEST_DELAY * 3).until(condition)
+        except TimeoutException:
+            logger.warning("Timed out waiting for %s on %s", description, self.driver.current_url)
+    
+    def _wait_for(self, selector: str):
+        """Wait until an element matching selector is present."""
+        self._wait_until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)), selector)
+    
     def crawl_restaurant(self, url: str) -> Dict[str, Any]:
         """Crawl a TripAdvisor restaurant page and extract information."""
-        logger.info(f"Crawling restaurant: {url}")
+        logger.info("Crawling restaurant: %s", url)
         
         # Check for demo mode
-        if os.getenv('DEMO_MODE', 'false').lower() == 'true':
-            logger.info(f"DEMO MODE: Using mock data instead of fetching {url}")
+        if config.DEMO_MODE:
+            logger.info("DEMO MODE: Using mock data instead of fetching %s", url)
             return self._create_mock_restaurant(url)
         
         try:
-            self.driver.get(url)
-            time.sleep(REQUEST_DELAY)  # Wait for JavaScript to load
-            
-            # Extract restaurant information
-            restaurant_data = {}
-            
-            # Get restaurant name (from meta tags)
-            try:
-                restaurant_name = self.driver.find_element(By.TAG_NAME, 'h1').text.strip()
-                restaurant_data['name'] = restaurant_name
-            except NoSuchElementException:
-                try:
-                    # Try getting from meta title
-                    title = self.driver.title
-                    if "," in title:
-                        restaurant_data['name'] = title.split(',')[0].strip()
-                    else:
-                        restaurant_data['name'] = "Unknown"
-                except:
-                    restaurant_data['name'] = "Unknown"
-            
-            # Extract address
-            try:
-                # Get structured data from the page if available
-                script_elements = self.driver.find_elements(By.XPATH, '//script[@type="application/ld+json"]')
-                for script in script_elements:
-                    try:
-                        data = json.loads(script.get_attribute('innerHTML'))
-                        if isinstance(data, dict) and 'address' in data:
-                            address_data = data['address']
-                            restaurant_data['address'] = address_data.get('streetAddress', '')
-                            restaurant_data['city'] = address_data.get('addressLocality', '')
-                            restaurant_data['state'] = address_data.get('addressRegion', '')
-                            restaurant_data['postal_code'] = address_data.get('postalCode', '')
-                            break
-                    except json.JSONDecodeError:
-                        continue
-            except:
-                restaurant_data['address'] = ''
-                restaurant_data['city'] = ''
-                restaurant_data['state'] = ''
-                restaurant_data['postal_code'] = ''
-            
-            # Extract rating
-            try:
-                # Look for rating in meta description
-                meta_desc = self.driver.find_element(By.XPATH, '//meta[@name="description"]')
-                desc_content = meta_desc.get_attribute('content')
-                
-                # Parse rating from description (e.g., "rated 4.4 of 5")
-                import re
-                rating_match = re.search(r'rated (\d+\.\d+) of 5', desc_content)
-                if rating_match:
-                    restaurant_data['average_rating'] = float(rating_match.group(1))
-                else:
-                    restaurant_data['average_rating'] = 0.0
-            except:
-                restaurant_data['average_rating'] = 0.0
-            
-            # Extract other details
-            restaurant_data['phone'] = ''
-            restaurant_data['website'] = ''
-            restaurant_data['cuisine_type'] = ''
-            restaurant_data['price_range'] = ''
-            restaurant_data['source_url'] = url
-            restaurant_data['source_id'] = url.split('-')[-1]
-            restaurant_data['source_platform'] = 'tripadvisor'
-            restaurant_data['last_updated'] = datetime.now()
+            # The name, JSON-LD address and rating are all in the server-rendered
+            # HTML, so try that first and only start the browser when it falls short
+            tree = self._fetch_restaurant_static(url)
+            restaurant_data = self._parse_restaurant_page(tree, url) if tree is not None else None
+            if restaurant_data is None or 'address' not in restaurant_data:
+                logger.info("No JSON-LD address in the static page, rendering %s", url)
+                self.driver.get(url)
+                self._wait_for(PAGE_READY_SELECTOR)
+                restaurant_data = self._parse_restaurant_page(lxml.html.fromstring(self.driver.page_source), url)
             
             return restaurant_data
             
         except Exception as e:
-            logger.error(f"Error crawling restaurant {url}: {str(e)}")
+            logger.error("Error crawling restaurant %s: %s", url, e)
             return {
                 'name': "Unknown",
                 'address': "",
@@ -169,15 +257,92 @@ class SeleniumTripAdvisorCrawler:
                 'last_updated': datetime.now()
             }
     
+    def _fetch_restaurant_static(self, url: str) -> Optional[lxml.html.HtmlElement]:
+        """Fetch and parse a restaurant page over plain HTTP, or None on failure."""
+        try:
+            response = self.http_client.get(url)
+            response.raise_for_status()
+            return lxml.html.fromstring(response.content)
+        except (httpx.HTTPError, etree.ParserError) as e:
+            logger.warning("Static fetch of %s failed: %s", url, e)
+            return None
+    
+    def _parse_restaurant_page(self, tree: lxml.html.HtmlElement, url: str) -> Dict[str, Any]:
+        """Extract restaurant information from a parsed page.
+        
+        The address fields are only set when the page has JSON-LD address data.
+        """
+        restaurant_data = {}
+        
+        # Get restaurant name (from meta tags)
+        headings = HEADING_XPATH(tree)
+        if headings:
+            # Collapse whitespace the way the browser renders it
+            restaurant_data['name'] = ' '.join(headings[0].text_content().split())
+        else:
+            # Try getting from meta title
+            title = ' '.join((tree.findtext('.//title') or "").split())
+            if "," in title:
+                restaurant_data['name'] = title.split(',')[0].strip()
+            else:
+                restaurant_data['name'] = "Unknown"
+        
+        # Extract address
+        try:
+            # Get structured data from the page if available
+            for script_text in JSON_LD_XPATH(tree):
+                try:
+                    data = orjson.loads(script_text)
+                    if isinstance(data, dict) and 'address' in data:
+                        address_data = data['address']
+                        restaurant_data['address'] = address_data.get('streetAddress', '')
+                        restaurant_data['city'] = address_data.get('addressLocality', '')
+                        restaurant_data['state'] = address_data.get('addressRegion', '')
+                        restaurant_data['postal_code'] = address_data.get('postalCode', '')
+                        break
+                except orjson.JSONDecodeError:
+                    continue
+        except:
+            restaurant_data['address'] = ''
+            restaurant_data['city'] = ''
+            restaurant_data['state'] = ''
+            restaurant_data['postal_code'] = ''
+        
+        # Extract rating
+        try:
+            # Look for rating in meta description
+            desc_content = META_DESCRIPTION_XPATH(tree)[0]
+            
+            # Parse rating from description (e.g., "rated 4.4 of 5")
+            rating_match = RATING_RE.search(desc_content)
+            if rating_match:
+                restaurant_data['average_rating'] = float(rating_match.group(1))
+            else:
+                restaurant_data['average_rating'] = 0.0
+        except:
+            restaurant_data['average_rating'] = 0.0
+        
+        # Extract other details
+        restaurant_data['phone'] = ''
+        restaurant_data['website'] = ''
+        restaurant_data['cuisine_type'] = ''
+        restaurant_data['price_range'] = ''
+        restaurant_data['source_url'] = url
+        restaurant_data['source_id'] = url.split('-')[-1]
+        restaurant_data['source_platform'] = 'tripadvisor'
+        restaurant_data['last_updated'] = datetime.now()
+        
+        return restaurant_data
+    
     def crawl_reviews(self, url: str, restaurant_id: int) -> List[Dict[str, Any]]:
         """Crawl TripAdvisor reviews for a restaurant."""
         # Check for demo mode
-        if os.getenv('DEMO_MODE', 'false').lower() == 'true':
-            logger.info(f"DEMO MODE: Using mock reviews data for {url}")
+        if config.DEMO_MODE:
+            logger.info("DEMO MODE: Using mock reviews data for %s", url)
             return self._create_mock_reviews(url, restaurant_id)
         
         reviews = []
-        logger.info(f"Crawling reviews for restaurant ID {restaurant_id}")
+        logger.info("Crawling reviews for restaurant ID %s", restaurant_id)
         
         try:
             # Navigate to the reviews page
@@ -187,192 +352,123 @@ class SeleniumTripAdvisorCrawler:
                 reviews_url = url
             
             self.driver.get(reviews_url)
-            time.sleep(REQUEST_DELAY * 2)  # Give extra time for reviews to load
+            self._wait_for(REVIEWS_READY_SELECTOR)
             
-            # First need to click "Read more" buttons if available to expand reviews
-            try:
-                read_more_buttons = self.driver.find_elements(By.XPATH, '//span[contains(text(), "Read more")]')
-                for button in read_more_buttons[:5]:  # Limit to 5 to avoid too many clicks
-                    try:
-                        self.driver.execute_script("arguments[0].click();", button)
-                        time.sleep(0.5)
-                    except:
-                        pass
-            except:
-                pass
-                
-            # Wait a bit for everything to load and stabilize
-            time.sleep(3)
-            
-            # Try multiple approaches to find review elements
-            review_elements = []
-            
-            # Approach 1: Modern data-automation attribute
-            elements = self.driver.find_elements(By.CSS_SELECTOR, '[data-automation="reviewCard"]')
-            if elements:
-                review_elements = elements
-                logger.info(f"Found {len(review_elements)} reviews using data-automation attribute")
-                
-            # Approach 2: Classic review containers
-            if not review_elements:
-                elements = self.driver.find_elements(By.CSS_SELECTOR, '.review-container')
-                if elements:
-                    review_elements = elements
-                    logger.info(f"Found {len(review_elements)} reviews using review-container class")
+            # Expand truncated reviews by clicking every "Read more" toggle in one
+            # call, then wait until they start expanding
+            clicked = self.driver.execute_script(READ_MORE_SCRIPT, True)
+            if clicked:
+                self._wait_until(
+                    lambda driver: driver.execute_script(READ_MORE_SCRIPT, False) < clicked,
+                    "reviews to expand",
+                )
             
-            # Approach 3: Generic review blocks using XPath
-            if not review_elements:
-                elements = self.driver.find_elements(By.XPATH, '//div[contains(@data-test-target, "review")]')
-                if elements:
-                    review_elements = elements
-                    logger.info(f"Found {len(review_elements)} reviews using data-test-target XPath")
+            # Find and read the review cards in one WebDriver call instead of a
+            # find_elements scan per approach and round trips per review
+            found = self.driver.execute_script(REVIEWS_SCRIPT, REVIEWER_SELECTORS, REVIEW_TEXT_SELECTORS)
+            review_fields = found['reviews']
+            if review_fields:
+                logger.info("Found %s reviews using %s", len(review_fields), found['strategy'])
             
-            # Approach 4: Look for review header and then get parent elements
-            if not review_elements:
-                try:
-                    review_headers = self.driver.find_elements(By.XPATH, '//div[contains(@class, "review-header")]')
-                    if review_headers:
-                        review_elements = [header.find_element(By.XPATH, './..') for header in review_headers]
-                        logger.info(f"Found {len(review_elements)} reviews using review headers")
-                except:
-                    pass
-            
-            # Approach 5: Look for any div containing review text and rating
-            if not review_elements:
-                try:
-                    # First try to identify if there's a reviews section
-                    sections = self.driver.find_elements(By.XPATH, '//div[contains(@id, "REVIEWS") or contains(@class, "reviews")]')
-                    if sections:
-                        # Extract all divs that might be review cards based on their depth and size
-                        for section in sections[:1]:  # Just use the first reviews section
-                            possible_reviews = section.find_elements(By.XPATH, './/div[.//span[contains(@class, "bubble") or contains(@class, "rating")] and .//p[string-length(text()) > 30]]')
-                            if possible_reviews:
-                                review_elements = possible_reviews
-                                logger.info(f"Found {len(review_elements)} reviews by identifying review-like divs")
-                                break
-                except:
-                    pass
-                    
             # Approach 6: Just scrape all reviews visible in the page HTML
-            if not review_elements:
+            if not review_fields:
                 try:
-                    # Save the page source for analysis with BeautifulSoup
-                    page_source = self.driver.page_source
-                    soup = BeautifulSoup(page_source, 'html.parser')
+                    # Parse just the reviews section for analysis with selectolax
+                    tree = LexborHTMLParser(self.driver.execute_script(REVIEWS_HTML_SCRIPT))
                     
                     # Look for elements that have both a rating and substantial text content
                     review_candidates = []
-                    rating_elements = soup.find_all('span', class_=lambda c: c and ('bubble' in c or 'rating' in c))
+                    rating_elements = tree.css('span:is([class*="bubble"], [class*="rating"])')
                     for rating_element in rating_elements:
                         # Find parent container that might be a review card
                         parent_div = rating_element
                         for _ in range(3):  # Go up to 3 levels
-                            parent_div = parent_div.parent if parent_div.parent else None
-                            if parent_div and parent_div.name == 'div':
+                            parent_div = parent_div.parent
+                            if parent_div is None:
+                                break
+                            if parent_div.tag == 'div':
                                 # Look for text of substantial length in this div
-                                text_elements = parent_div.find_all('p')
-                                text_content = ' '.join([t.text for t in text_elements if t.text])
+                                text_content = ' '.join(text for text in (p.text() for p in parent_div.css('p')) if text)
                                 if len(text_content) > 50:  # Assume reviews are at least 50 chars
                                     review_candidates.append({
                                         'element': parent_div,
-                                        'rating_text': rating_element.text.strip(),
+                                        'rating_text': rating_element.text().strip(),
                                         'text': text_content
                                     })
                                     break
                     
                     # Process these candidates manually
                     if review_candidates:
-                        logger.info(f"Found {len(review_candidates)} review candidates using BeautifulSoup analysis")
+                        logger.info("Found %s review candidates in the page HTML", len(review_candidates))
                         # We'll need to process these differently below
                         return self._extract_reviews_from_soup(review_candidates, url, restaurant_id)
                         
                 except Exception as e:
-                    logger.error(f"Error during BeautifulSoup processing: {str(e)}")
-            
-            logger.info(f"Found {len(review_elements)} review elements")
+                    logger.error("Error while scanning the page HTML: %s", e)
             
-            for i, review_element in enumerate(review_elements):
+            # One timestamp for the whole page, used for undated reviews and crawl_date
+            now = datetime.now()
+            for i, fields in enumerate(review_fields):
                 try:
                     # Extract reviewer name
-                    try:
-                        reviewer_name_elem = review_element.find_element(By.CSS_SELECTOR, '.info_text div:first-child')
-                        reviewer_name = reviewer_name_elem.text.strip()
-                    except:
-                        try:
-                            # Try alternate selector
-                            reviewer_name_elem = review_element.find_element(By.CSS_SELECTOR, '[data-automation="reviewerName"]')
-                            reviewer_name = reviewer_name_elem.text.strip()
-                        except:
-                            reviewer_name = f"User_{i+1}"
+                    if fields['reviewer_name'] is not None:
+                        reviewer_name = fields['reviewer_name'].strip()
+                    else:
+                        reviewer_name = f"User_{i+1}"
                     
                     # Extract rating
                     try:
-                        rating_elem = review_element.find_element(By.CSS_SELECTOR, 'span.ui_bubble_rating')
-                        rating_class = rating_elem.get_attribute('class')
-                        rating = float(rating_class.split('_')[-1]) / 10
-                    except:
-                        try:
-                            # Try alternate selector
-                            rating_elem = review_element.find_element(By.CSS_SELECTOR, '[data-automation="reviewRating"]')
-                            rating_text = rating_elem.get_attribute('aria-label')
-                            if rating_text:
-                                rating = float(rating_text.split('/')[0].strip())
-                            else:
-                                rating = 0.0
-                        except:
+                        rating = float(fields['bubble_class'].split('_')[-1]) / 10
+                    except (AttributeError, ValueError):
+                        # Alternate selector
+                        rating_text = fields['rating_label']
+                        if rating_text is None:
                             rating = 3.0  # Default if not found
+                        elif rating_text:
+                            try:
+                                rating = float(rating_text.split('/')[0].strip())
+                            except ValueError:
+                                rating = 3.0
+                        else:
+                            rating = 0.0
                     
                     # Extract review date
-                    try:
-                        date_elem = review_element.find_element(By.CSS_SELECTOR, '.ratingDate')
-                        date_text = date_elem.get_attribute('title') or date_elem.text
+                    date_text = fields['rating_date']
+                    if date_text is not None:
                         if not date_text or 'date of' in date_text.lower():
-                            review_date = datetime.now() - timedelta(days=i)
+                            review_date = now - timedelta(days=i)
                         else:
                             try:
-                                review_date = datetime.strptime(date_text, "%B %d, %Y")
-                            except:
-                                review_date = datetime.now() - timedelta(days=i)
-                    except:
-                        try:
-                            # Try alternate selector
-                            date_elem = review_element.find_element(By.CSS_SELECTOR, '[data-automation="reviewDate"]')
-                            date_text = date_elem.text
-                            if date_text:
-                                try:
-                                    if 'wrote a review' in date_text:
-                                        date_parts = date_text.split('wrote a review')
-                                        if len(date_parts) > 1:
-                                            date_text = date_parts[1].strip()
-                                    review_date = datetime.strptime(date_text, "%B %Y")
-                                except:
-                                    review_date = datetime.now() - timedelta(days=i)
-                            else:
-                                review_date = datetime.now() - timedelta(days=i)
-                        except:
-                            review_date = datetime.now() - timedelta(days=i)
+                                review_date = _parse_date(date_text, DATE_FORMAT)
+                            except ValueError:
+                                review_date = now - timedelta(days=i)
+                    else:
+                        # Alternate selector
+                        date_text = fields['automation_date']
+                        if date_text:
+                            try:
+                                if 'wrote a review' in date_text:
+                                    date_parts = date_text.split('wrote a review')
+                                    if len(date_parts) > 1:
+                                        date_text = date_parts[1].strip()
+                                review_date = _parse_date(date_text, MONTH_DATE_FORMAT)
+                            except ValueError:
+                                review_date = now - timedelta(days=i)
+                        else:
+                            review_date = now - timedelta(days=i)
                     
                     # Extract review text
-                    try:
-                        text_elem = review_element.find_element(By.CSS_SELECTOR, '.prw_reviews_text_summary_hsx')
-                        review_text = text_elem.text.strip()
-                    except:
-                        try:
-                            # Try alternate selector
-                            text_elem = review_element.find_element(By.CSS_SELECTOR, '[data-automation="reviewText"]')
-                            review_text = text_elem.text.strip()
-                        except:
-                            try:
-                                # Just get all text as a fallback
-                                review_text = review_element.text
-                                # Remove reviewer name and date if they appear in the text
-                                if reviewer_name in review_text:
-                                    review_text = review_text.replace(reviewer_name, '')
-                                if date_text in review_text:
-                                    review_text = review_text.replace(date_text, '')
-                                review_text = review_text.strip()
-                            except:
-                                review_text = f"Review {i+1}"
+                    if fields['review_text'] is not None:
+                        review_text = fields['review_text'].strip()
+                    else:
+                        # Just get all text as a fallback
+                        review_text = fields['card_text']
+                        # Remove reviewer name and date if they appear in the text
+                        if reviewer_name in review_text:
+                            review_text = review_text.replace(reviewer_name, '')
+                        if date_text and date_text in review_text:
+                            review_text = review_text.replace(date_text, '')
+                        review_text = review_text.strip()
                     
                     # Generate a unique source_id
                     source_id = f"tripadvisor_{restaurant_id}_{i}_{int(review_date.timestamp())}"
@@ -388,42 +484,34 @@ class SeleniumTripAdvisorCrawler:
                         'source_url': url,
                         'source_id': source_id,
                         'source_platform': 'tripadvisor',
-                        'crawl_date': datetime.now()
+                        'crawl_date': now
                     }
                     
                     reviews.append(review_data)
                     
                 except Exception as e:
-                    logger.error(f"Error parsing review {i}: {str(e)}")
+                    logger.error("Error parsing review %s: %s", i, e)
             
             return reviews
             
         except Exception as e:
-            logger.error(f"Error crawling reviews from {url}: {str(e)}")
+            logger.error("Error crawling reviews from %s: %s", url, e)
             return []
     
     def save_restaurant(self, restaurant_data: Dict[str, Any]) -> Restaurant:
         """Save restaurant to database."""
         try:
-            # Check if restaurant already exists based on source_url
-            restaurant = self.db_session.query(Restaurant).filter_by(
-                source_url=restaurant_data['source_url']
-            ).first()
-            
-            if restaurant:
-                # Update existing restaurant
-                for key, value in restaurant_data.items():
-                    setattr(restaurant, key, value)
-            else:
-                # Create new restaurant
-                restaurant = Restaurant(**restaurant_data)
-                self.db_session.add(restaurant)
+            # Insert or update in one statement, keyed on source_url
+            stmt = upsert(Restaurant, 'source_url', restaurant_data).returning(Restaurant)
+            restaurant = self.db_session.scalars(
+                stmt, [restaurant_data], execution_options={'populate_existing': True}
+            ).one()
             
             self.db_session.commit()
             return restaurant
         except Exception as e:
             self.db_session.rollback()
-            logger.error(f"Error saving restaurant: {str(e)}")
+            logger.error("Error saving restaurant: %s", e)
             raise
     
     def save_review(self, review_data: Dict[str, Any], restaurant_id: int) -> Review:
@@ -432,30 +520,31 @@ class SeleniumTripAdvisorCrawler:
             # Add restaurant_id to review data
             review_data['restaurant_id'] = restaurant_id
             
-            # Check if review already exists based on source_id
-            review = self.db_session.query(Review).filter_by(
-                source_id=review_data['source_id']
-            ).first()
-            
-            if review:
-                # Update existing review
-                for key, value in review_data.items():
-                    setattr(review, key, value)
-            else:
-                # Create new review
-                review = Review(**review_data)
-                self.db_session.add(review)
+            # Insert or update in one statement, keyed on source_id
+            stmt = upsert(Review, 'source_id', review_data).returning(Review)
+            review = self.db_session.scalars(
+                stmt, [review_data], execution_options={'populate_existing': True}
+            ).one()
             
             self.db_session.commit()
             return review
         except Exception as e:
             self.db_session.rollback()
-            logger.error(f"Error saving review: {str(e)}")
+            logger.error("Error saving review: %s", e)
             raise
     
+    def save_reviews_bulk(self, review_data_list: List[Dict[str, Any]], restaurant_id: int) -> int:
+        """Save a batch of reviews to database in a single transaction."""
+        for review_data in review_data_list:
+            review_data['restaurant_id'] = restaurant_id
+        # One batched upsert, shared with the HTTP crawlers
+        return save_reviews(self.db_session, review_data_list)
+    
     def close(self):
-        """Close database session and WebDriver."""
-        self.db_session.close()
+        """Close the HTTP client and WebDriver, and the database session unless it was injected."""
+        if self._owns_db_session:
+            self.db_session.close()
+        self.http_client.close()
         if self.driver:
             self.driver.quit()
     
@@ -479,9 +568,10 @@ class SeleniumTripAdvisorCrawler:
         }
     
     def _extract_reviews_from_soup(self, review_candidates: List[Dict], url: str, restaurant_id: int) -> List[Dict[str, Any]]:
-        """Process BeautifulSoup review candidates into review data."""
+        """Process page-source review candidates into review data."""
         reviews = []
         
+        now = datetime.now()
         for i, candidate in enumerate(review_candidates):
             try:
                 # Extract review text
@@ -506,25 +596,26 @@ class SeleniumTripAdvisorCrawler:
                 # Extract reviewer name
                 reviewer_name = "Unknown"
                 try:
-                    name_element = candidate['element'].find('span', class_=lambda c: c and 'username' in c)
-                    if name_element:
-                        reviewer_name = name_element.text.strip()
+                    name_element = candidate['element'].css_first('span[class*="username"]')
+                    if name_element is not None:
+                        reviewer_name = name_element.text().strip()
                     else:
                         # Try other approaches
-                        name_divs = candidate['element'].find_all('div', class_=lambda c: c and ('member' in c or 'user' in c))
+                        name_divs = candidate['element'].css('div:is([class*="member"], [class*="user"])')
                         for div in name_divs:
-                            if div.text and len(div.text.strip()) < 30:  # Username likely short
-                                reviewer_name = div.text.strip()
+                            div_text = div.text().strip()
+                            if div_text and len(div_text) < 30:  # Username likely short
+                                reviewer_name = div_text
                                 break
                 except:
                     pass
                 
                 # Extract date or use a mock date
-                review_date = datetime.now() - timedelta(days=i*7)
+                review_date = now - timedelta(days=i*7)
                 try:
-                    date_element = candidate['element'].find('span', class_=lambda c: c and ('date' in c or 'when' in c))
-                    if date_element and date_element.text:
-                        date_text = date_element.text.strip()
+                    date_element = candidate['element'].css_first('span:is([class*="date"], [class*="when"])')
+                    if date_element is not None and date_element.text():
+                        date_text = date_element.text().strip()
                         # Try various date formats
                         try:
                             if 'wrote a review' in date_text:
@@ -534,10 +625,10 @@ class SeleniumTripAdvisorCrawler:
                             
                             if ',' in date_text:
                                 # Format like "January 15, 2023"
-                                review_date = datetime.strptime(date_text, "%B %d, %Y")
-                            elif any(month in date_text for month in ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']):
+                                review_date = _parse_date(date_text, DATE_FORMAT)
+                            elif MONTH_RE.search(date_text):
                                 # Format like "Jan 2023"
-                                review_date = datetime.strptime(date_text, "%b %Y")
+                                review_date = _parse_date(date_text, SHORT_MONTH_DATE_FORMAT)
                         except:
                             pass
                 except:
@@ -557,20 +648,18 @@ class SeleniumTripAdvisorCrawler:
                     'source_url': url,
                     'source_id': source_id,
                     'source_platform': 'tripadvisor',
-                    'crawl_date': datetime.now()
+                    'crawl_date': now
                 }
                 
                 reviews.append(review_data)
                 
             except Exception as e:
-                logger.error(f"Error processing BeautifulSoup review candidate {i}: {str(e)}")
+                logger.error("Error processing review candidate %s: %s", i, e)
         
         return reviews
         
     def _create_mock_reviews(self, url: str, restaurant_id: int) -> List[Dict[str, Any]]:
         """Create mock reviews for demo mode."""
-        mock_reviews = []
-        
         review_texts = [
             "Excellent food! The kottu roti was particularly good, and the service was top-notch. Will definitely be coming back here again.",
             "We tried this restaurant for the first time and were very impressed. The flavors were authentic and the portions generous. Highly recommend the string hoppers!",
@@ -583,11 +672,14 @@ class SeleniumTripAdvisorCrawler:
         
         ratings = [5.0, 4.0, 4.5, 3.5, 5.0, 3.0, 4.5]
         
-        for i in range(7):
-            review_date = datetime.now() - timedelta(days=i*10)
-            mock_reviews.append({
-                'rating': ratings[i],
-                'review_text': review_texts[i],
+        # One clock read for the whole batch
+        now = datetime.now()
+        review_dates = [now - timedelta(days=i*10) for i in range(len(ratings))]
+        
+        return [
+            {
+                'rating': rating,
+                'review_text': review_text,
                 'review_date': review_date,
                 'reviewer_name': f"MockReviewer{i+1}",
                 'reviewer_id': f"reviewer_{i}",
@@ -595,7 +687,7 @@ class SeleniumTripAdvisorCrawler:
                 'source_url': url,
                 'source_id': f"tripadvisor_{restaurant_id}_mock_{i}_{int(review_date.timestamp())}",
                 'source_platform': 'tripadvisor',
-                'crawl_date': datetime.now()
-            })
-        
-        return mock_reviews
\ No newline at end of file
+                'crawl_date': now
+            }
+            for i, (rating, review_text, review_date) in enumerate(zip(ratings, review_texts, review_dates))
+        ]
\ No newline at end of file
@@ -1,65 +1,251 @@
+import asyncio
+import os
+import tempfile
 import unittest
-from unittest.mock import patch, MagicMock
+from datetime import date
+from unittest.mock import patch, AsyncMock, MagicMock
 
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from selectolax.lexbor import LexborHTMLParser
 
-from src.crawler import BaseCrawler, YelpCrawler
+from src.crawler import BaseCrawler, YelpCrawler, create_http_session
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+# Raw fixture bytes, read once; the parser detects the encoding itself
+YELP_RESTAURANT_HTML = _read_fixture('yelp_restaurant.html')
+YELP_REVIEWS_HTML = _read_fixture('yelp_reviews.html')
 
 
 class MockResponse:
     def __init__(self, text, status_code=200):
         self.text = text
+        self.content = text.encode('utf-8')
         self.status_code = status_code
+        self.status = status_code
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def read(self):
+        return self.content
 
     def raise_for_status(self):
         if self.status_code >= 400:
-            raise requests.exceptions.HTTPError(f"HTTP Error: {self.status_code}")
+            raise aiohttp.ClientError(f"HTTP Error: {self.status_code}")
+
+
+class FakeResult:
+    def __init__(self, row):
+        self._row = row
+
+    def one(self):
+        return self._row
+
+    def __iter__(self):
+        # A list of rows, for statements that return several
+        return iter(self._row)
+
+
+class FakeSession:
+    """The Session methods the crawlers use, recording statements instead of running them
+
+    There is deliberately no query(): saves are expected to go out as upserts.
+    """
+
+    def __init__(self, returned_row=None):
+        self.returned_row = returned_row
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def execute(self, statement, params=None, **kwargs):
+        self.executed.append((statement, params))
+        return FakeResult(self.returned_row)
+
+    def scalars(self, statement, params=None, **kwargs):
+        self.executed.append((statement, params))
+        return FakeResult(self.returned_row)
 
+    def commit(self):
+        self.commits += 1
 
-class TestBaseCrawler(unittest.TestCase):
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class TestBaseCrawler(unittest.IsolatedAsyncioTestCase):
     """Test the BaseCrawler class functionality"""
 
-    @patch('src.crawler.get_db_session')
-    def setUp(self, mock_get_db_session):
-        self.mock_db_session = MagicMock()
-        mock_get_db_session.return_value = self.mock_db_session
+    def setUp(self):
+        self.db_session = FakeSession()
         
         # Create a concrete implementation of BaseCrawler for testing
         class ConcreteCrawler(BaseCrawler):
-            def crawl_restaurant(self, url):
+            async def crawl_restaurant(self, url):
                 return {"name": "Test Restaurant", "source_url": url}
             
-            def crawl_reviews(self, url, restaurant_id):
+            async def crawl_reviews(self, url, restaurant_id, limit=None):
                 return [{"rating": 5.0, "review_text": "Great place!", "source_id": "test123"}]
         
-        self.crawler = ConcreteCrawler()
+        # Record delays instead of waiting them out
+        self.mock_sleep = AsyncMock()
+        self.crawler = ConcreteCrawler(self.db_session, sleep=self.mock_sleep)
+        self.crawler.session = MagicMock()
 
-    @patch('requests.Session.get')
-    @patch('time.sleep')
-    def test_fetch_page(self, mock_sleep, mock_get):
+    async def test_fetch_tree(self):
+        mock_get = self.crawler.session.get
+        timeout = aiohttp.ClientTimeout(total=30)
+        
         # Test successful fetch
         html_content = "<html><body><h1>Test Page</h1></body></html>"
         mock_get.return_value = MockResponse(html_content)
         
-        result = self.crawler.fetch_page("https://example.com")
+        result = await self.crawler.fetch_tree("https://example.com")
         
-        self.assertIsInstance(result, BeautifulSoup)
-        self.assertEqual(result.h1.text, "Test Page")
-        mock_get.assert_called_once_with("https://example.com", timeout=30)
-        mock_sleep.assert_called_once()
+        self.assertIsInstance(result, LexborHTMLParser)
+        self.assertEqual(result.css_first('h1').text(), "Test Page")
+        mock_get.assert_called_once_with("https://example.com", timeout=timeout)
+        # Nothing to wait for on the first request to a host
+        self.mock_sleep.assert_not_called()
         
         # Test failed fetch
         mock_get.reset_mock()
-        mock_sleep.reset_mock()
+        self.mock_sleep.reset_mock()
         mock_get.return_value = MockResponse("", status_code=404)
-        mock_get.return_value.raise_for_status = lambda: exec('raise requests.exceptions.HTTPError("404")')
         
-        result = self.crawler.fetch_page("https://example.com/not-found")
+        result = await self.crawler.fetch_tree("https://example.com/not-found")
         
         self.assertIsNone(result)
-        mock_get.assert_called_once_with("https://example.com/not-found", timeout=30)
-        mock_sleep.assert_not_called()
+        mock_get.assert_called_once_with("https://example.com/not-found", timeout=timeout)
+        # The second request to the same host waits out REQUEST_DELAY
+        self.mock_sleep.assert_called_once()
+
+    async def test_fetch_tree_delays_per_host(self):
+        self.crawler.session.get.side_effect = lambda url, timeout: MockResponse("<html></html>")
+        
+        await self.crawler.fetch_tree("https://a.example.com/1")
+        await self.crawler.fetch_tree("https://b.example.com/1")
+        self.mock_sleep.assert_not_called()
+        
+        await self.crawler.fetch_tree("https://a.example.com/2")
+        self.mock_sleep.assert_called_once()
+
+    async def test_fetch_tree_delays_across_crawlers_sharing_a_throttle(self):
+        other = type(self.crawler)(FakeSession(), MagicMock(), sleep=self.mock_sleep, host_throttle=self.crawler.host_throttle)
+        for crawler in (self.crawler, other):
+            crawler.session.get.side_effect = lambda url, timeout: MockResponse("<html></html>")
+        
+        await self.crawler.fetch_tree("https://example.com/1")
+        await other.fetch_tree("https://www.example.com/2")
+        
+        self.mock_sleep.assert_called_once()
+
+    def test_fetch_tree_in_separate_event_loops(self):
+        class SlowResponse(MockResponse):
+            async def __aenter__(self):
+                # Let the other fetch queue up on the host lock
+                await asyncio.sleep(0)
+                return self
+        
+        async def crawl():
+            crawler = type(self.crawler)(FakeSession(), MagicMock(), sleep=self.mock_sleep)
+            crawler.session.get.side_effect = lambda url, timeout: SlowResponse("<html></html>")
+            return await asyncio.gather(crawler.fetch_tree("https://example.com/a"), crawler.fetch_tree("https://example.com/b"))
+        
+        # e.g. crawl_all run twice by an embedder; each run waits on its own locks
+        for _ in range(2):
+            self.assertTrue(all(asyncio.run(crawl())))
+
+    async def test_fetch_tree_retries_transient_errors(self):
+        mock_get = self.crawler.session.get
+        mock_get.side_effect = [
+            MockResponse("", status_code=503),
+            MockResponse("<html><body><h1>Test Page</h1></body></html>"),
+        ]
+        
+        result = await self.crawler.fetch_tree("https://example.com")
+        
+        self.assertEqual(result.css_first('h1').text(), "Test Page")
+        self.assertEqual(mock_get.call_count, 2)
+        # One backoff pause before the retry
+        self.mock_sleep.assert_called_once()
+
+    async def test_fetch_tree_records_unchanged_pages(self):
+        response = MockResponse("<html><body><h1>Test Page</h1></body></html>")
+        # What a cached session returns once the site answers 304
+        response.from_cache = True
+        self.crawler.session.get.return_value = response
+        
+        await self.crawler.fetch_tree("https://example.com/a")
+        result = await self.crawler.fetch_tree("https://example.com/b")
+        
+        self.assertEqual(result.css_first('h1').text(), "Test Page")
+        self.assertTrue(self.crawler.page_unchanged("https://example.com/b"))
+        self.assertFalse(self.crawler.page_unchanged("https://example.com/c"))
+        # The 304 still came from the site, so the next request waits
+        self.mock_sleep.assert_called_once()
+
+    async def test_fetch_tree_reuses_cached_page(self):
+        mock_get = self.crawler.session.get
+        mock_get.return_value = MockResponse("<html><body><h1>Test Page</h1></body></html>")
+
+        first = await self.crawler.fetch_tree("https://example.com")
+        second = await self.crawler.fetch_tree("https://example.com")
+
+        self.assertIs(first, second)
+        mock_get.assert_called_once_with("https://example.com", timeout=aiohttp.ClientTimeout(total=30))
+
+    async def test_fetch_tree_evicts_oldest_page(self):
+        crawler = type(self.crawler)(FakeSession(), MagicMock(), page_cache_size=1, sleep=self.mock_sleep)
+        crawler.session.get.side_effect = lambda url, timeout: MockResponse("<html></html>")
+        
+        await crawler.fetch_tree("https://example.com/a")
+        await crawler.fetch_tree("https://example.com/b")
+        await crawler.fetch_tree("https://example.com/a")
+        
+        self.assertEqual(crawler.session.get.call_count, 3)
+
+    async def test_close_leaves_injected_sessions_open(self):
+        shared_db_session = FakeSession()
+        shared_http_session = MagicMock()
+        shared_http_session.close = AsyncMock()
+        crawler = type(self.crawler)(shared_db_session, shared_http_session)
+        
+        self.assertIs(crawler.db_session, shared_db_session)
+        self.assertIs(crawler._get_session(), shared_http_session)
+        
+        await crawler.close()
+        
+        self.assertFalse(shared_db_session.closed)
+        shared_http_session.close.assert_not_called()
+
+    async def test_close_is_idempotent(self):
+        owned_http_session = self.crawler.session
+        owned_http_session.close = AsyncMock()
+        
+        await self.crawler.close()
+        await self.crawler.close()
+        
+        owned_http_session.close.assert_awaited_once()
+        # A closed crawler reopens a session rather than using the closed one
+        with patch('src.crawler.create_http_session') as mock_create_http_session:
+            self.assertIs(self.crawler._get_session(), mock_create_http_session.return_value)
 
     def test_save_restaurant(self):
         # Test saving a new restaurant
@@ -70,63 +256,140 @@ class TestBaseCrawler(unittest.TestCase):
             "source_id": "123"
         }
         
-        # Configure mock to return None for query.first() (no existing restaurant)
-        self.mock_db_session.query().filter_by().first.return_value = None
+        saved_restaurant = object()
+        self.db_session.returned_row = saved_restaurant
         
-        self.crawler.save_restaurant(restaurant_data)
+        result = self.crawler.save_restaurant(restaurant_data)
         
-        # Check that add was called
-        self.mock_db_session.add.assert_called_once()
-        self.mock_db_session.commit.assert_called_once()
-        
-        # Test updating an existing restaurant
-        self.mock_db_session.reset_mock()
-        mock_restaurant = MagicMock()
-        self.mock_db_session.query().filter_by().first.return_value = mock_restaurant
+        # Inserted or updated with a single upsert statement, no lookup query
+        self.assertIs(result, saved_restaurant)
+        self.assertEqual(len(self.db_session.executed), 1)
+        self.assertEqual(self.db_session.executed[0][1], [restaurant_data])
+        self.assertEqual(self.db_session.commits, 1)
+
+    def test_save_reviews_bulk(self):
+        reviews = [
+            {"rating": 5.0, "review_text": "Great place!", "source_id": "first"},
+            {"rating": 3.0, "review_text": "Okay", "source_id": "second"},
+            {"rating": 4.0, "review_text": "Edited", "source_id": "first"},
+        ]
         
-        self.crawler.save_restaurant(restaurant_data)
+        saved_count = self.crawler.save_reviews_bulk(reviews, 123)
         
-        # Check that add was not called (updating existing)
-        self.mock_db_session.add.assert_not_called()
-        self.mock_db_session.commit.assert_called_once()
+        # Duplicates collapse to the latest copy and all rows go out in one upsert
+        self.assertEqual(saved_count, 2)
+        self.assertEqual(len(self.db_session.executed), 1)
+        rows = self.db_session.executed[0][1]
+        self.assertEqual([(row["source_id"], row["review_text"]) for row in rows], [("first", "Edited"), ("second", "Okay")])
+        self.assertTrue(all(row["restaurant_id"] == 123 for row in rows))
+        self.assertEqual(self.db_session.commits, 1)
 
+class TestHttpCache(unittest.IsolatedAsyncioTestCase):
+    """Fetch pages from a local server through the cached HTTP session"""
 
-class TestYelpCrawler(unittest.TestCase):
+    PAGE = "<html><body><h1>Cached Page</h1></body></html>"
+
+    async def asyncSetUp(self):
+        # (path, If-None-Match) of each request the server received
+        self.requests = []
+
+        async def page(request):
+            etag = request.headers.get('If-None-Match')
+            self.requests.append((request.path, etag))
+            if request.path == '/no-validators':
+                return web.Response(text=self.PAGE, content_type='text/html')
+            if etag == '"v1"':
+                return web.Response(status=304, headers={'ETag': '"v1"'})
+            return web.Response(text=self.PAGE, content_type='text/html', headers={'ETag': '"v1"'})
+
+        app = web.Application()
+        app.router.add_get('/{name}', page)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.addAsyncCleanup(self.server.close)
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.http_session = create_http_session(os.path.join(cache_dir.name, 'cache.sqlite'))
+        self.addAsyncCleanup(self.http_session.close)
+
+    async def _fetch(self, path):
+        """Fetch with a new crawler, as a later run would"""
+        crawler = YelpCrawler(FakeSession(), self.http_session, sleep=AsyncMock())
+        url = str(self.server.make_url(path))
+        tree = await crawler.fetch_tree(url)
+        return tree.css_first('h1').text(), crawler.page_unchanged(url)
+
+    async def test_cached_page_is_revalidated(self):
+        self.assertEqual(await self._fetch('/page'), ("Cached Page", False))
+        self.assertEqual(await self._fetch('/page'), ("Cached Page", True))
+
+        self.assertEqual(self.requests, [('/page', None), ('/page', '"v1"')])
+
+    async def test_page_without_validators_is_downloaded_again(self):
+        self.assertEqual(await self._fetch('/no-validators'), ("Cached Page", False))
+        self.assertEqual(await self._fetch('/no-validators'), ("Cached Page", False))
+
+        self.assertEqual(self.requests, [('/no-validators', None), ('/no-validators', None)])
+
+
+class TestYelpCrawler(unittest.IsolatedAsyncioTestCase):
     """Test the YelpCrawler class functionality"""
     
-    @patch('src.crawler.get_db_session')
-    def setUp(self, mock_get_db_session):
-        self.mock_db_session = MagicMock()
-        mock_get_db_session.return_value = self.mock_db_session
-        self.crawler = YelpCrawler()
+    @classmethod
+    def setUpClass(cls):
+        # Parse each fixture once; the crawler only reads the trees it is given
+        cls._restaurant_tree = LexborHTMLParser(YELP_RESTAURANT_HTML)
+        cls._reviews_tree = LexborHTMLParser(YELP_REVIEWS_HTML)
+        # The tests stub fetch_tree and never save, so one crawler serves them all
+        cls.crawler = YelpCrawler(FakeSession())
     
-    @patch.object(YelpCrawler, 'fetch_page')
-    def test_crawl_restaurant(self, mock_fetch_page):
-        # Create a mock BeautifulSoup object with restaurant data
-        with open('tests/fixtures/yelp_restaurant.html', 'r', encoding='utf-8') as f:
-            mock_soup = BeautifulSoup(f.read(), 'html.parser')
+    @patch.object(YelpCrawler, 'fetch_tree')
+    async def test_crawl_restaurant(self, mock_fetch_tree):
+        mock_fetch_tree.return_value = self._restaurant_tree
         
-        mock_fetch_page.return_value = mock_soup
-        
-        result = self.crawler.crawl_restaurant("https://www.yelp.com/biz/test-restaurant")
+        result = await self.crawler.crawl_restaurant("https://www.yelp.com/biz/test-restaurant")
         
         # Validate result
         self.assertEqual(result.get('name'), "Test Restaurant")
         self.assertEqual(result.get('source_platform'), "yelp")
     
-    @patch.object(YelpCrawler, 'fetch_page')
-    def test_crawl_reviews(self, mock_fetch_page):
-        # Create a mock BeautifulSoup object with review data
-        with open('tests/fixtures/yelp_reviews.html', 'r', encoding='utf-8') as f:
-            mock_soup = BeautifulSoup(f.read(), 'html.parser')
-        
-        mock_fetch_page.return_value = mock_soup
+    @patch.object(YelpCrawler, 'fetch_tree')
+    async def test_crawl_reviews(self, mock_fetch_tree):
+        mock_fetch_tree.return_value = self._reviews_tree
         
-        result = self.crawler.crawl_reviews("https://www.yelp.com/biz/test-restaurant", 123)
+        result = await self.crawler.crawl_reviews("https://www.yelp.com/biz/test-restaurant", 123)
         
         # Validate result
         self.assertIsInstance(result, list)
         self.assertEqual(len(result), 10)  # Assuming fixture has 10 reviews
+        
+        # Check every review's fields in one comparison
+        expected = [
+            ("John D.", 5.0, date(2023, 10, 15), 10),
+            ("Sarah M.", 4.0, date(2023, 10, 10), 5),
+            ("Mike K.", 5.0, date(2023, 10, 5), 8),
+            ("Emily L.", 3.0, date(2023, 10, 1), 3),
+            ("Alex T.", 4.0, date(2023, 9, 28), 4),
+            ("Jessica R.", 5.0, date(2023, 9, 25), 7),
+            ("David B.", 4.0, date(2023, 9, 20), 6),
+            ("Lisa W.", 3.0, date(2023, 9, 15), 2),
+            ("Robert C.", 5.0, date(2023, 9, 10), 12),
+            ("Michelle P.", 4.0, date(2023, 9, 5), 4),
+        ]
+        actual = [
+            (review['reviewer_name'], review['rating'], review['review_date'].date(), review['helpful_count'])
+            for review in result
+        ]
+        self.assertEqual(actual, expected)
+    
+    @patch.object(YelpCrawler, 'fetch_tree')
+    async def test_crawl_reviews_stops_at_limit(self, mock_fetch_tree):
+        mock_fetch_tree.return_value = self._reviews_tree
+        
+        result = await self.crawler.crawl_reviews("https://www.yelp.com/biz/test-restaurant", 123, limit=3)
+        
+        self.assertEqual(len(result), 3)
 
 
 if __name__ == '__main__':
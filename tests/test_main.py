@@ -0,0 +1,345 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from functools import partial
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.crawler import canonical_host, create_http_session
+from src.main import (
+    CrawlOptions, _canonical_url, _crawled_restaurants, _dedupe_urls, _next_write_batch, _shard_urls_by_host,
+    _write_reviews, crawl_all, crawl_restaurant,
+)
+from tests.test_crawler import YELP_RESTAURANT_HTML, YELP_REVIEWS_HTML, FakeSession
+
+
+def _reviews(restaurant_id, count=1):
+    return [
+        {'source_id': f"yelp_{restaurant_id}_{index}", 'restaurant_id': restaurant_id, 'rating': 4.0}
+        for index in range(count)
+    ]
+
+
+class TestSkipCrawled(unittest.IsolatedAsyncioTestCase):
+    URLS = ['https://yelp.com/biz/one', 'https://yelp.com/biz/two', 'https://yelp.com/biz/three']
+
+    def setUp(self):
+        # (source_url, id) of the restaurants already in the database
+        self.db_session = FakeSession(returned_row=[('https://yelp.com/biz/two', 2)])
+
+        @contextmanager
+        def db_session_scope():
+            yield FakeSession()
+
+        for patcher in (
+            patch('src.database.db_session_scope', db_session_scope),
+            patch('src.crawler.create_http_session', MagicMock()),
+            patch('src.main.get_crawler', return_value=([AsyncMock()], 'Yelp')),
+            patch('src.main.crawl_restaurant', AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_crawled_restaurants(self):
+        self.assertEqual(_crawled_restaurants(self.URLS, self.db_session), {'https://yelp.com/biz/two': 2})
+        self.assertEqual(len(self.db_session.executed), 1)
+
+    async def _crawled_urls(self, refresh):
+        from src import main
+
+        await crawl_all(CrawlOptions('yelp', 10, 4, refresh), self.URLS, self.db_session)
+        for call in main.crawl_restaurant.call_args_list:
+            self.assertEqual(call.kwargs['crawled'], {'https://yelp.com/biz/two': 2})
+        return [call.args[1] for call in main.crawl_restaurant.call_args_list]
+
+    async def test_crawl_all_skips_crawled_urls(self):
+        with self.assertLogs('restaurant_crawler_main', 'INFO'):
+            urls = await self._crawled_urls(refresh=False)
+
+        self.assertEqual(urls, ['https://yelp.com/biz/one', 'https://yelp.com/biz/three'])
+
+    async def test_crawl_all_keeps_crawled_urls_on_refresh(self):
+        self.assertEqual(await self._crawled_urls(refresh=True), self.URLS)
+
+
+class TestRefresh(unittest.IsolatedAsyncioTestCase):
+    """Crawl a restaurant that is already in the database again with --refresh"""
+
+    async def asyncSetUp(self):
+        self.etag = '"v1"'
+        # (path and query, If-None-Match) of each request the server received
+        self.requests = []
+
+        async def page(request):
+            self.requests.append((request.path_qs, request.headers.get('If-None-Match')))
+            if request.headers.get('If-None-Match') == self.etag:
+                return web.Response(status=304, headers={'ETag': self.etag})
+            body = YELP_REVIEWS_HTML if 'sort_by' in request.query else YELP_RESTAURANT_HTML
+            return web.Response(body=body, content_type='text/html', headers={'ETag': self.etag})
+
+        app = web.Application()
+        app.router.add_get('/biz/{name}', page)
+        server = TestServer(app)
+        await server.start_server()
+        self.addAsyncCleanup(server.close)
+        self.url = str(server.make_url('/biz/one'))
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.db_session = FakeSession(returned_row=MagicMock(id=1))
+
+        @contextmanager
+        def db_session_scope():
+            yield FakeSession()
+
+        for patcher in (
+            patch('src.crawler.create_http_session', partial(create_http_session, os.path.join(cache_dir.name, 'cache.sqlite'))),
+            patch('src.crawler.REQUEST_DELAY', 0),
+            patch('src.database.db_session_scope', db_session_scope),
+            patch('src.main._crawled_restaurants', return_value={self.url: 1}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _refresh(self):
+        """Crawl with --refresh, returning the requests the server received and whether the restaurant was saved"""
+        self.requests.clear()
+        self.db_session.executed.clear()
+        await crawl_all(CrawlOptions('yelp', 10, 4, True), [self.url], self.db_session)
+        return self.requests[:], len(self.db_session.executed) == 1
+
+    async def test_refresh_revalidates_cached_pages_with_the_site(self):
+        reviews_path = '/biz/one?sort_by=date_desc'
+        self.assertEqual(await self._refresh(), ([('/biz/one', None), (reviews_path, None)], True))
+
+        # Unchanged: both pages are asked for again, and the restaurant is kept as saved
+        self.assertEqual(await self._refresh(), ([('/biz/one', '"v1"'), (reviews_path, '"v1"')], False))
+
+        # Changed: the new pages are downloaded and the restaurant is saved again
+        self.etag = '"v2"'
+        self.assertEqual(await self._refresh(), ([('/biz/one', '"v1"'), (reviews_path, '"v1"')], True))
+
+
+class TestCrawlRestaurant(unittest.IsolatedAsyncioTestCase):
+    URL = 'https://yelp.com/biz/one'
+
+    def setUp(self):
+        self.crawler = MagicMock()
+        self.crawler.crawl_restaurant = AsyncMock(return_value={'name': "Test Restaurant", 'source_url': self.URL})
+        self.crawler.crawl_reviews = AsyncMock(side_effect=lambda url, restaurant_id, limit: _reviews(restaurant_id))
+        self.crawler.save_restaurant.return_value.id = 7
+        self.write_queue = asyncio.Queue()
+
+    async def _crawl(self, unchanged, crawled):
+        self.crawler.page_unchanged.return_value = unchanged
+        await crawl_restaurant(self.crawler, self.URL, 10, self.write_queue, crawled)
+        return self.write_queue.get_nowait()
+
+    async def test_unchanged_restaurant_is_not_saved_again(self):
+        reviews = await self._crawl(unchanged=True, crawled={self.URL: 3})
+
+        self.crawler.save_restaurant.assert_not_called()
+        self.assertEqual(reviews, _reviews(3))
+
+    async def test_changed_restaurant_is_saved(self):
+        reviews = await self._crawl(unchanged=False, crawled={self.URL: 3})
+
+        self.crawler.save_restaurant.assert_called_once()
+        self.assertEqual(reviews, _reviews(7))
+
+    async def test_unchanged_page_of_unsaved_restaurant_is_saved(self):
+        # e.g. the page was cached by a run whose save failed
+        reviews = await self._crawl(unchanged=True, crawled={})
+
+        self.crawler.save_restaurant.assert_called_once()
+        self.assertEqual(reviews, _reviews(7))
+
+
+class TestWriterFailure(unittest.IsolatedAsyncioTestCase):
+    """crawl_all when the review writer dies before the crawls are done"""
+
+    def setUp(self):
+        @contextmanager
+        def db_session_scope():
+            raise RuntimeError("database is down")
+            yield
+
+        async def crawl(crawler, url, max_reviews, write_queue, crawled):
+            await write_queue.put(_reviews(1))
+
+        self.crawler = AsyncMock()
+        for patcher in (
+            patch('src.database.db_session_scope', db_session_scope),
+            patch('src.crawler.create_http_session', MagicMock()),
+            patch('src.main._crawled_restaurants', return_value={}),
+            patch('src.main.get_crawler', return_value=([self.crawler], 'Yelp')),
+            patch('src.main.crawl_restaurant', crawl),
+            # Full after one restaurant, so the crawls would block on it
+            patch('src.main.WRITE_QUEUE_SIZE', 1),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_writer_error_is_raised_instead_of_hanging(self):
+        urls = [f"https://yelp.com/biz/{index}" for index in range(10)]
+
+        with self.assertRaisesRegex(RuntimeError, "database is down"):
+            await asyncio.wait_for(crawl_all(CrawlOptions('yelp', 10, 4, False), urls, FakeSession()), 1)
+
+        self.crawler.close.assert_awaited_once()
+
+
+class TestCanonicalUrl(unittest.TestCase):
+    # (url, canonical key)
+    CASES = [
+        ('https://www.yelp.com/biz/one', 'https://yelp.com/biz/one'),
+        ('HTTPS://WWW.Yelp.com/biz/one', 'https://yelp.com/biz/one'),
+        ('https://yelp.com/biz/one/', 'https://yelp.com/biz/one'),
+        ('https://yelp.com/biz/one?utm_source=mail&utm_medium=email', 'https://yelp.com/biz/one'),
+        ('https://yelp.com/biz/one?fbclid=abc&gclid=def', 'https://yelp.com/biz/one'),
+        ('https://yelp.com/biz/one#reviews', 'https://yelp.com/biz/one'),
+        ('https://maps.google.com/maps?cid=42&hl=en', 'https://maps.google.com/maps?cid=42&hl=en'),
+        ('https://maps.google.com/maps?hl=en&utm_campaign=x&cid=42', 'https://maps.google.com/maps?cid=42&hl=en'),
+        # Paths are case-sensitive on most sites
+        ('https://yelp.com/biz/One', 'https://yelp.com/biz/One'),
+    ]
+
+    def test_canonical_url(self):
+        for url, expected in self.CASES:
+            with self.subTest(url=url):
+                self.assertEqual(_canonical_url(url), expected)
+
+
+class TestDedupeUrls(unittest.TestCase):
+    # (urls, deduplicated urls)
+    CASES = [
+        ([], []),
+        (['https://yelp.com/biz/one'], ['https://yelp.com/biz/one']),
+        (
+            ['https://www.yelp.com/biz/one/', 'https://yelp.com/biz/one?utm_source=x', 'https://yelp.com/biz/one#top'],
+            ['https://www.yelp.com/biz/one/'],
+        ),
+        (
+            ['https://yelp.com/biz/two', 'https://yelp.com/biz/one', 'https://www.yelp.com/biz/two/'],
+            ['https://yelp.com/biz/two', 'https://yelp.com/biz/one'],
+        ),
+        (
+            ['https://maps.google.com/maps?cid=1', 'https://maps.google.com/maps?cid=2'],
+            ['https://maps.google.com/maps?cid=1', 'https://maps.google.com/maps?cid=2'],
+        ),
+    ]
+
+    def test_dedupe_urls(self):
+        for urls, expected in self.CASES:
+            with self.subTest(urls=urls):
+                self.assertEqual(_dedupe_urls(urls), expected)
+
+
+class TestShardUrlsByHost(unittest.TestCase):
+    URLS = [
+        'https://www.yelp.com/biz/one',
+        'https://yelp.com/biz/two',
+        'https://WWW.YELP.COM/biz/three',
+        'https://www.tripadvisor.com/Restaurant_Review-one',
+        'https://tripadvisor.com/Restaurant_Review-two',
+        'https://www.google.com/maps/place/one',
+        'https://maps.google.com/maps/place/two',
+    ]
+
+    def test_host_is_never_split_across_shards(self):
+        for shards in range(1, len(self.URLS) + 2):
+            with self.subTest(shards=shards):
+                groups = _shard_urls_by_host(self.URLS, shards)
+
+                shard_by_host = {}
+                for index, group in enumerate(groups):
+                    for url in group:
+                        self.assertEqual(shard_by_host.setdefault(canonical_host(url), index), index, url)
+                self.assertEqual(sorted(url for group in groups for url in group), sorted(self.URLS))
+
+    def test_one_shard_per_host_at_most(self):
+        groups = _shard_urls_by_host(self.URLS, 10)
+
+        # yelp.com, tripadvisor.com, google.com and maps.google.com
+        self.assertEqual(len(groups), 4)
+
+
+class TestNextWriteBatch(unittest.IsolatedAsyncioTestCase):
+    async def test_full_batch_is_returned_without_waiting(self):
+        write_queue = asyncio.Queue()
+        for restaurant_id in range(5):
+            write_queue.put_nowait(_reviews(restaurant_id))
+
+        with patch('src.main.WRITE_BATCH_SIZE', 3), patch('src.main.WRITE_BATCH_INTERVAL', 60):
+            batch = await asyncio.wait_for(_next_write_batch(write_queue), 1)
+
+        self.assertEqual(batch, [_reviews(0), _reviews(1), _reviews(2)])
+        self.assertEqual(write_queue.qsize(), 2)
+
+    async def test_partial_batch_is_returned_after_the_interval(self):
+        write_queue = asyncio.Queue()
+        write_queue.put_nowait(_reviews(1))
+
+        with patch('src.main.WRITE_BATCH_INTERVAL', 0.01):
+            batch = await asyncio.wait_for(_next_write_batch(write_queue), 1)
+
+        self.assertEqual(batch, [_reviews(1)])
+
+    async def test_batch_ends_at_none(self):
+        write_queue = asyncio.Queue()
+        for item in (_reviews(1), None, _reviews(2)):
+            write_queue.put_nowait(item)
+
+        with patch('src.main.WRITE_BATCH_INTERVAL', 60):
+            batch = await asyncio.wait_for(_next_write_batch(write_queue), 1)
+
+        self.assertEqual(batch, [_reviews(1), None])
+
+
+class TestWriteReviews(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.db_session = FakeSession()
+
+        @contextmanager
+        def db_session_scope():
+            yield self.db_session
+
+        patcher = patch('src.database.db_session_scope', db_session_scope)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_none_drains_the_queue_and_stops_the_writer(self):
+        write_queue = asyncio.Queue()
+        for item in (_reviews(1, 2), _reviews(2), None):
+            write_queue.put_nowait(item)
+
+        with patch('src.main.WRITE_BATCH_INTERVAL', 60):
+            await asyncio.wait_for(_write_reviews(write_queue), 1)
+
+        self.assertTrue(write_queue.empty())
+        self.assertEqual(len(self.db_session.executed), 1)
+        _, rows = self.db_session.executed[0]
+        self.assertEqual(rows, _reviews(1, 2) + _reviews(2))
+        self.assertEqual(self.db_session.commits, 1)
+
+    async def test_failed_save_is_logged_and_the_writer_keeps_going(self):
+        write_queue = asyncio.Queue()
+        for item in (_reviews(1), _reviews(2), None):
+            write_queue.put_nowait(item)
+
+        with patch('src.main.WRITE_BATCH_SIZE', 1), \
+                patch('src.crawler.save_reviews', side_effect=[RuntimeError('database is down'), 1]) as save_reviews, \
+                self.assertLogs('restaurant_crawler_main', 'INFO') as logs:
+            await asyncio.wait_for(_write_reviews(write_queue), 1)
+
+        self.assertEqual([call.args[1] for call in save_reviews.call_args_list], [_reviews(1), _reviews(2)])
+        self.assertIn("ERROR:restaurant_crawler_main:Dropped reviews for 1 restaurants", logs.output)
+        self.assertIn("INFO:restaurant_crawler_main:Saved 1 reviews for 1 restaurants", logs.output)
+
+
+if __name__ == '__main__':
+    unittest.main()